@@ -25,6 +25,16 @@ class AMSR_E_L3(MODIS_L3):
 
         return variables
 
+    def _get_start_date(self, filename):
+        from cis.time_util import cis_standard_time_unit
+        from hdf_eos_metadata import get_range_datetimes
+        return cis_standard_time_unit.date2num(get_range_datetimes(filename)[0])
+
+    def _get_end_date(self, filename):
+        from cis.time_util import cis_standard_time_unit
+        from hdf_eos_metadata import get_range_datetimes
+        return cis_standard_time_unit.date2num(get_range_datetimes(filename)[1])
+
     def _create_cube(self, filenames, variable):
         import numpy as np
         from cis.data_io.hdf import _read_hdf4
@@ -3,9 +3,10 @@ A plugin for reading BAS aircraft files
 """
 from cis.data_io.products import AProduct
 import logging
+from time_averaging import TimeAveraged
 
 
-class BAS_aircraft(AProduct):
+class BAS_aircraft(TimeAveraged, AProduct):
 
     def get_file_signature(self):
         return [r'.*\.nc']
@@ -15,6 +16,10 @@ class BAS_aircraft(AProduct):
         from cis.data_io.Coord import Coord, CoordList
         from cis.data_io.ungridded_data import UngriddedCoordinates, UngriddedData
         from cis.exceptions import InvalidVariableError
+        from time_averaging import WindowAverager
+
+        averager = WindowAverager(self, usr_variable)
+        usr_variable = averager.variable
 
         # We have to read it once first to find out which variables are in there. We assume the set of coordinates in
         # all the files are the same
@@ -49,12 +54,22 @@ class BAS_aircraft(AProduct):
 
         coords = CoordList()
         var_data = read_many_files_individually(filenames, [v[0] for v in all_variables])
+
+        if averager.window is not None:
+            time_names = [name for name, axis_std_name in coord_variables if axis_std_name[0] == 't']
+            if not time_names:
+                raise InvalidVariableError("Unable to average over time as there is no time variable in {}"
+                                           .format(filenames[0]))
+            averager.average(var_data, time_names[0],
+                             {name: 360 for name, axis_std_name in coord_variables if axis_std_name[1] == 'longitude'})
+
         for name, axis_std_name in coord_variables:
             try:
                 meta = get_metadata(var_data[name][0])
                 if meta.standard_name is None:
                     meta.standard_name = axis_std_name[1]
-                coords.append(Coord(var_data[name], meta, axis=axis_std_name[0]))
+                data, meta = averager.get_data(var_data, name, meta)
+                coords.append(Coord(data, meta, axis=axis_std_name[0]))
             except InvalidVariableError:
                 pass
 
@@ -64,7 +79,8 @@ class BAS_aircraft(AProduct):
         if usr_variable is None:
             res = UngriddedCoordinates(coords)
         else:
-            res = UngriddedData(var_data[usr_variable], get_metadata(var_data[usr_variable][0]), coords)
+            data, meta = averager.get_data(var_data, usr_variable, get_metadata(var_data[usr_variable][0]))
+            res = UngriddedData(data, meta, coords)
 
         return res
 
@@ -1,12 +1,14 @@
 from cis.data_io.products.NCAR_NetCDF_RAF import NCAR_NetCDF_RAF, NCAR_NetCDF_RAF_variable_name_selector
 
+from netcdf_campaign import CampaignProduct
+
 
 class CLARIFY_variable_name_selector(NCAR_NetCDF_RAF_variable_name_selector):
     # Static air pressure value for faam rack measurements
     CORRECTED_PRESSURE_VAR_NAME = 'P9_STAT'
 
 
-class CLARIFY(NCAR_NetCDF_RAF):
+class CLARIFY(CampaignProduct, NCAR_NetCDF_RAF):
 
     def __init__(self, variable_selector_class=CLARIFY_variable_name_selector):
         """
@@ -15,3 +17,18 @@ class CLARIFY(NCAR_NetCDF_RAF):
         :return:nothing
         """
         super(CLARIFY, self).__init__(variable_selector_class=variable_selector_class)
+
+    def create_coords(self, filenames, variable=None):
+        """
+        Reads the coordinates and data if required from the files, averaging them over time windows if an
+        averaging_window is set
+        :param filenames: List of filenames to read coordinates from
+        :param variable: load a variable for the data
+        :return: Coordinates
+        """
+        from time_averaging import get_averaging_window
+
+        window = get_averaging_window(self)
+        if window is not None:
+            return self._create_averaged_coords(filenames, variable, window)
+        return super(CLARIFY, self).create_coords(filenames, variable)
@@ -31,33 +31,11 @@ class OMI_Aura_L3(NetCDF_Gridded):
 
     def get_variable_names(self, filenames, data_type=None):
         """
-        This is exactly the same as the inherited version except I also exclude the mlev dimension
+        This is exactly the same as the inherited version except I also exclude the mlev dimension. Only the header
+        of the first file is read (the files are assumed to be a homogeneous series), so no cubes are loaded.
         """
-        import iris
-        import cf_units as unit
-        variables = []
-
-        cubes = iris.load(filenames, callback=self.load_multiple_files_callback)
-
-        for cube in cubes:
-            is_time_lat_lon_pressure_altitude_or_has_only_1_point = True
-            for dim in cube.dim_coords:
-                units = dim.units
-                if dim.points.size > 1 and \
-                        not units.is_time() and \
-                        not units.is_time_reference() and \
-                        not units.is_vertical() and \
-                        not units.is_convertible(unit.Unit('degrees')) and \
-                        dim.var_name != 'mlev':
-                    is_time_lat_lon_pressure_altitude_or_has_only_1_point = False
-                    break
-            if is_time_lat_lon_pressure_altitude_or_has_only_1_point:
-                if cube.var_name:
-                    variables.append(cube.var_name)
-                else:
-                    variables.append(cube.name())
-
-        return set(variables)
+        from netcdf_header import get_gridded_variable_names
+        return get_gridded_variable_names(filenames[:1], allowed_dimensions=('mlev',))
 
     def get_file_signature(self):
         return [r'.*\.nc']
@@ -0,0 +1,76 @@
+"""
+Compare concatenating a variable from a set of mixed-endian campaign files by byte-swapping each file's data and then
+concatenating it (the old GASSP get_data path), with swapping it as it's copied into a preallocated buffer
+(netcdf_campaign.concatenate_into).
+
+Usage: python benchmarks/bench_endian_concatenation.py [<variable> <netcdf file> ...]
+If no files are given a set of synthetic files, alternating big- and little-endian, is created in a temporary directory.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+N_FILES = 20
+N_RECORDS = 500000
+
+
+def create_files(directory, n_files=N_FILES, n_records=N_RECORDS):
+    from netCDF4 import Dataset
+
+    filenames = []
+    for i in range(n_files):
+        filename = os.path.join(directory, 'campaign_{}.nc'.format(i))
+        with Dataset(filename, 'w') as f:
+            f.createDimension('Time', n_records)
+            endian = 'big' if i % 2 else 'little'
+            var = f.createVariable('CN', '>f8' if i % 2 else '<f8', ('Time',), endian=endian)
+            var[:] = np.random.random(n_records)
+        filenames.append(filename)
+    return filenames
+
+
+def open_variables(filenames, variable):
+    from netCDF4 import Dataset
+    return [Dataset(f).variables[variable] for f in filenames]
+
+
+def swap_then_concatenate(variables):
+    arrays = []
+    for var in variables:
+        data = var[:]
+        if data.dtype.byteorder not in ('=', '|'):
+            data = data.byteswap().view(data.dtype.newbyteorder())
+        arrays.append(data)
+    return np.ma.concatenate(arrays)
+
+
+def swap_into_buffer(variables):
+    from netcdf_campaign import concatenate_into
+    return concatenate_into((var[:] for var in variables), sum(var.shape[0] for var in variables))
+
+
+def main(variable, filenames, repeats=3):
+    variables = open_variables(filenames, variable)
+    byte_orders = set(var[:1].dtype.byteorder for var in variables)
+    print("{} files, {} records, byte orders read: {}".format(len(filenames), sum(v.shape[0] for v in variables),
+                                                               sorted(byte_orders)))
+
+    old, new = swap_then_concatenate(variables), swap_into_buffer(variables)
+    assert np.ma.allequal(old, new) and new.dtype.isnative
+
+    for fn in (swap_then_concatenate, swap_into_buffer):
+        time = min(timeit.repeat(lambda: fn(variables), number=1, repeat=repeats))
+        print("{:24s} {:.3f}s".format(fn.__name__, time))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        main(sys.argv[1], sys.argv[2:])
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            main('CN', create_files(tmp))
@@ -0,0 +1,66 @@
+"""
+Compare the vectorized 5km->1km MODIS geolocation interpolator with the geotiepoints one, for accuracy and speed, on a
+synthetic swath which crosses the dateline and passes close to the pole (or on the 5km Latitude/Longitude of a real
+MOD06 granule).
+
+Usage: python benchmarks/bench_modis_interpolation.py [MOD06 granule] [repeats]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_swath(lines=406, cols=270):
+    """
+    Tie-points along a polar orbit ground track with a ~2300km wide swath, crossing the dateline near the pole
+    """
+    along = np.deg2rad(np.linspace(60, 100, lines))[:, np.newaxis]
+    across = np.deg2rad(np.linspace(-10.5, 10.5, cols))[np.newaxis, :]
+    inclination = np.deg2rad(98.2)
+    # Rotate a great circle, offset across-track, into the orbital plane
+    x = np.cos(along) * np.cos(across)
+    y = np.sin(along) * np.cos(across)
+    z = np.sin(across) * np.ones_like(along)
+    y, z = y * np.cos(inclination) - z * np.sin(inclination), y * np.sin(inclination) + z * np.cos(inclination)
+    lons = np.rad2deg(np.arctan2(y, x)) + 180.0
+    lons = (lons + 180.0) % 360.0 - 180.0
+    lats = np.rad2deg(np.arcsin(z))
+    return lons, lats
+
+
+def read_granule(filename):
+    from pyhdf.SD import SD
+    sd = SD(filename)
+    return sd.select('Longitude').get(), sd.select('Latitude').get()
+
+
+def great_circle_distance_km(lons1, lats1, lons2, lats2):
+    lons1, lats1, lons2, lats2 = [np.deg2rad(np.asarray(a, dtype=np.float64)) for a in (lons1, lats1, lons2, lats2)]
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def main(filename=None, repeats=3):
+    from modis_fixed import modis5kmto1km, modis5kmto1km_geotiepoints
+
+    lons5km, lats5km = read_granule(filename) if filename else synthetic_swath()
+
+    reference = modis5kmto1km_geotiepoints(lons5km, lats5km)
+    result = modis5kmto1km(lons5km, lats5km)
+    distance = great_circle_distance_km(reference[0], reference[1], result[0], result[1])
+    print("1km grid: {}, max difference {:.4f} km, mean difference {:.4f} km".format(
+        result[0].shape, distance.max(), distance.mean()))
+    # Ignore the border, where geotiepoints extrapolates its tie-points before interpolating
+    print("Interior (excluding the outer 5 pixels) max difference {:.4f} km".format(distance[5:-5, 5:-5].max()))
+
+    for name, fn in [('geotiepoints', modis5kmto1km_geotiepoints), ('vectorized', modis5kmto1km)]:
+        best = min(timeit.repeat(lambda: fn(lons5km, lats5km), number=1, repeat=repeats))
+        print("{:>14}: {:.4f} s".format(name, best))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(r) for r in sys.argv[2:3]])
@@ -0,0 +1,57 @@
+"""
+Compare reading a Vdata through the nested-list round-trip, np.array(vd.read(nRec=n)).flatten(), with
+hdf_vdata.read_vdata.
+
+Usage: python benchmarks/bench_vdata_read.py <hdf file> [vdata name] [repeats]
+e.g.   python benchmarks/bench_vdata_read.py 2008001005724_08958_CS_2B-GEOPROF_GRANULE_P_R04_E02.hdf Profile_time
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def read_with_lists(filename, variable):
+    import numpy as np
+    from pyhdf.HDF import HDF
+
+    datafile = HDF(filename)
+    vs = datafile.vstart()
+    vd = vs.attach(variable)
+    data = np.array(vd.read(nRec=vd.inquire()[0])).flatten()
+    vd.detach()
+    vs.end()
+    datafile.close()
+    return data
+
+
+def read_with_buffer(filename, variable):
+    from pyhdf.HDF import HDF
+    from hdf_vdata import read_vdata
+
+    datafile = HDF(filename)
+    vs = datafile.vstart()
+    vd = vs.attach(variable)
+    data = read_vdata(vd)
+    vd.detach()
+    vs.end()
+    datafile.close()
+    return data
+
+
+def main(filename, variable='Profile_time', repeats=5):
+    import numpy as np
+
+    expected = read_with_lists(filename, variable)
+    result = read_with_buffer(filename, variable)
+    np.testing.assert_array_equal(expected, result)
+    print("{} values of {} ({} -> {})".format(expected.size, variable, expected.dtype, result.dtype))
+
+    for name, fn in [('list round-trip', read_with_lists), ('read_vdata', read_with_buffer)]:
+        best = min(timeit.repeat(lambda: fn(filename, variable), number=1, repeat=repeats))
+        print("{:>16}: {:.4f} s".format(name, best))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *sys.argv[2:3], *[int(r) for r in sys.argv[3:4]])
@@ -368,9 +368,9 @@ def get_data(vds, first_record=False, missing_values=None):
     :param missing_values:
     :return:
     """
-    import numpy as np
     from pyhdf.HDF import HDF, HDF4Error
     from cis.utils import create_masked_array_for_missing_values
+    from hdf_vdata import read_vdata
 
     # get file and variable reference from tuple
     filename = vds.filename
@@ -386,15 +386,11 @@ def get_data(vds, first_record=False, missing_values=None):
     if first_record:
         # FIXME - This is the only bit that is actually different to the baseline
         vd = vs.attach('metadata')
-        vd.setfields(variable)
-        data = vd.read()
+        data = read_vdata(vd, nrec=1, fields=[variable])
     else:
         # get data for that variable
         vd = vs.attach(variable)
-        data = vd.read(nRec=vd.inquire()[0])
-
-    # create numpy array from data
-    data = np.array(data).flatten()
+        data = read_vdata(vd)
 
     # dealing with missing data
     if missing_values is None:
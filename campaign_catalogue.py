@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import sqlite3
+
+# The name of the catalogue file kept in each campaign archive directory
+CATALOGUE_FILENAME = '.cis_campaign_catalogue.sqlite'
+
+# Optional directory to keep the catalogues in instead (e.g. if the archive is read-only)
+CATALOGUE_DIR = os.environ.get('CIS_CAMPAIGN_CATALOGUE_DIR', None)
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS campaign_files (
+    filename TEXT,
+    product TEXT,
+    mtime REAL,
+    size INTEGER,
+    file_format TEXT,
+    start_time REAL,
+    end_time REAL,
+    lon_min REAL,
+    lon_max REAL,
+    lat_min REAL,
+    lat_max REAL,
+    alt_min REAL,
+    alt_max REAL,
+    variables TEXT,
+    PRIMARY KEY (filename, product))"""
+
+
+def get_catalogue_filename(directory):
+    directory = os.path.abspath(directory)
+    if CATALOGUE_DIR is None:
+        return os.path.join(directory, CATALOGUE_FILENAME)
+    import hashlib
+    return os.path.join(CATALOGUE_DIR, hashlib.md5(directory.encode()).hexdigest() + CATALOGUE_FILENAME)
+
+
+def _connect(catalogue_filename):
+    connection = sqlite3.connect(catalogue_filename)
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def _get_product_name(product):
+    return product if isinstance(product, str) else type(product).__name__
+
+
+def _get_range(variable):
+    import numpy as np
+    from cis.data_io.netcdf import get_data
+
+    data = np.ma.masked_invalid(get_data(variable))
+    if data.count() == 0:
+        return None, None
+    return float(data.min()), float(data.max())
+
+
+def _read_file_extent(product, filename):
+    """
+    Read the time span, lat/lon/alt bounds and variables of a single campaign file, opening it only once
+
+    :param product: The GASSP, GASSP_Cube or CLARIFY product instance used to interpret the file
+    :param filename: The file to read
+    :return: A tuple of the catalogue columns from file_format onwards
+    """
+    import numpy as np
+    from cf_units import Unit
+    from cis.data_io.netcdf import get_metadata
+    from cis.time_util import convert_time_using_time_stamp_info_to_std_time as convert, cis_standard_time_unit
+    from cis.utils import listify
+
+    file_format = product.get_file_format(filename)
+    variable_selector = product._load_data_definition([filename])
+    variables = variable_selector.file_variables[0]
+
+    time_var = variables[variable_selector.time_variable_name]
+    units = get_metadata(time_var).units
+    start, end = _get_range(time_var)
+    if start is not None:
+        if variable_selector.time_stamp_info is not None:
+            start, end = convert(np.array([start, end]), units, listify(variable_selector.time_stamp_info)[0])
+        else:
+            start, end = Unit(str(units)).convert(np.array([start, end]), cis_standard_time_unit)
+
+    if variable_selector.station:
+        lat_min = lat_max = float(variable_selector.station_latitude)
+        lon_min = lon_max = float(variable_selector.station_longitude)
+    else:
+        lat_min, lat_max = _get_range(variables[variable_selector.latitude_variable_name])
+        lon_min, lon_max = _get_range(variables[variable_selector.longitude_variable_name])
+
+    if variable_selector.altitude is not None:
+        alt_min = alt_max = float(variable_selector.altitude)
+    else:
+        alt_min, alt_max = _get_range(variables[variable_selector.altitude_variable_name])
+
+    return (file_format, float(start) if start is not None else None, float(end) if end is not None else None,
+            lon_min, lon_max, lat_min, lat_max, alt_min, alt_max,
+            json.dumps(sorted(variable_selector.get_variable_names_which_have_time_coord())))
+
+
+def update_campaign_catalogue(filenames, product, catalogue_filename, remove_missing=False):
+    """
+    Add any new (or modified) files to a catalogue. Any which the product can't read are catalogued (with a warning)
+    without an extent, so that they're always included by queries.
+
+    :param filenames: The campaign files to catalogue
+    :param product: The GASSP, GASSP_Cube or CLARIFY product instance used to read the files
+    :param catalogue_filename: The SQLite catalogue file
+    :param remove_missing: Remove the product's rows for any files which aren't in filenames (e.g. when filenames is
+     a scan of the whole archive, so that deleted or renamed files are dropped)
+    """
+    product_name = _get_product_name(product)
+    connection = _connect(catalogue_filename)
+    with connection:
+        catalogued = {row[0]: (row[1], row[2]) for row in
+                      connection.execute("SELECT filename, mtime, size FROM campaign_files WHERE product = ?",
+                                         (product_name,))}
+        filenames = [os.path.abspath(filename) for filename in filenames]
+        if remove_missing:
+            missing = set(catalogued) - set(filenames)
+            connection.executemany("DELETE FROM campaign_files WHERE filename = ? AND product = ?",
+                                   [(filename, product_name) for filename in missing])
+        for filename in filenames:
+            stat = os.stat(filename)
+            if catalogued.get(filename, None) == (stat.st_mtime, stat.st_size):
+                continue
+            try:
+                extent = _read_file_extent(product, filename)
+            except Exception as e:
+                logging.warning("Unable to read the extent of {} as {}, it won't be filtered: {}"
+                                .format(filename, product_name, e))
+                extent = (None,) * 10
+            connection.execute("INSERT OR REPLACE INTO campaign_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (filename, product_name, stat.st_mtime, stat.st_size) + extent)
+    connection.close()
+
+
+def build_campaign_catalogue(directory, product, pattern='*.nc', recursive=True):
+    """
+    Create (or bring up to date) the catalogue of all the campaign files in an archive directory. Only new or
+    modified files are read, and any files which are no longer in the archive are removed from it.
+
+    :param directory: The archive directory
+    :param product: The GASSP, GASSP_Cube or CLARIFY product instance used to read the files
+    :param pattern: A glob pattern for the campaign files
+    :param recursive: Include files in sub-directories (e.g. one per campaign)
+    :return: The catalogue filename
+    """
+    import glob
+    catalogue_filename = get_catalogue_filename(directory)
+    if recursive:
+        filenames = glob.glob(os.path.join(directory, '**', pattern), recursive=True)
+    else:
+        filenames = glob.glob(os.path.join(directory, pattern))
+    update_campaign_catalogue(filenames, product, catalogue_filename, remove_missing=True)
+    return catalogue_filename
+
+
+def query_campaign_catalogue(catalogue_filename, product, lon_min=None, lon_max=None, lat_min=None, lat_max=None,
+                             alt_min=None, alt_max=None, start=None, end=None, variable=None, file_format=None):
+    """
+    Find the files in a catalogue which overlap a region and period, without opening any of them. Any bounds which
+    aren't given are not constrained, and files with unknown extents are always included. Files which no longer exist
+    are skipped.
+
+    :param catalogue_filename: The SQLite catalogue file
+    :param product: The product (instance or class name) the files were catalogued with
+    :param lon_min: The western edge of the region
+    :param lon_max: The eastern edge of the region
+    :param lat_min: The southern edge of the region
+    :param lat_max: The northern edge of the region
+    :param alt_min: The lowest altitude
+    :param alt_max: The highest altitude
+    :param start: The start of the period, as a datetime
+    :param end: The end of the period, as a datetime
+    :param variable: Only include files containing this variable
+    :param file_format: Only include files whose format starts with this (e.g. 'NetCDF/GASSP')
+    :return: A sorted list of the matching filenames
+    """
+    from cis.time_util import cis_standard_time_unit
+
+    clauses, parameters = ["product = ?"], [_get_product_name(product)]
+
+    def overlaps(min_column, max_column, low, high):
+        if high is not None:
+            clauses.append("({0} IS NULL OR {0} <= ?)".format(min_column))
+            parameters.append(high)
+        if low is not None:
+            clauses.append("({0} IS NULL OR {0} >= ?)".format(max_column))
+            parameters.append(low)
+
+    overlaps('lon_min', 'lon_max', lon_min, lon_max)
+    overlaps('lat_min', 'lat_max', lat_min, lat_max)
+    overlaps('alt_min', 'alt_max', alt_min, alt_max)
+    overlaps('start_time', 'end_time', cis_standard_time_unit.date2num(start) if start is not None else None,
+             cis_standard_time_unit.date2num(end) if end is not None else None)
+    if file_format is not None:
+        clauses.append("(file_format IS NULL OR file_format LIKE ?)")
+        parameters.append(file_format + '%')
+
+    connection = _connect(catalogue_filename)
+    rows = connection.execute("SELECT filename, variables FROM campaign_files WHERE " + " AND ".join(clauses),
+                              parameters).fetchall()
+    connection.close()
+    return sorted(filename for filename, variables in rows
+                  if (variable is None or variables is None or variable in json.loads(variables)) and
+                  os.path.exists(filename))
@@ -1,22 +1,219 @@
 import logging
+import os
+from collections import OrderedDict
 from cis.data_io import hdf as hdf
 from cis.data_io.Coord import Coord, CoordList
 from cis.data_io.products import AProduct
 from cis.data_io.ungridded_data import Metadata, UngriddedCoordinates, UngriddedData
 import cis.utils as utils
 
+# The maximum number of granules to keep the scale factors and offsets of in memory
+GRANULE_SCALINGS_CACHE_SIZE = 64
+
+# Per-granule '<var>_add_offset' and '<var>_scale_factor' Vdata values, keyed by (path, mtime, size) so that rewritten
+#  files aren't served stale values, with the least recently used evicted first
+_GRANULE_SCALINGS = OrderedDict()
+
+
+def _get_granule_scalings(filename, vs=None):
+    """
+    Read all of the scale factor and offset Vdata values in a CloudSat granule in a single pass. The values are cached
+    per granule so that decoding many SD variables from the same file only walks the Vdata interface once.
+
+    :param filename: The CloudSat granule to read
+    :param vs: An optional, already open, Vdata interface for the granule
+    :return: A tuple of two dictionaries, (offsets, scale_factors), keyed by SD variable name
+    """
+    from pyhdf.HDF import HDF, HDF4Error
+
+    stat = os.stat(filename)
+    key = os.path.abspath(filename), stat.st_mtime, stat.st_size
+    if key in _GRANULE_SCALINGS:
+        _GRANULE_SCALINGS.move_to_end(key)
+        return _GRANULE_SCALINGS[key]
+
+    datafile = None
+    if vs is None:
+        try:
+            datafile = HDF(filename)
+        except HDF4Error as e:
+            raise IOError(e)
+        vs = datafile.vstart()
+
+    offsets, scale_factors = {}, {}
+    for vdata_info in vs.vdatainfo():
+        name = vdata_info[0]
+        if name.endswith('_add_offset'):
+            target, variable = offsets, name[:-len('_add_offset')]
+        elif name.endswith('_scale_factor'):
+            target, variable = scale_factors, name[:-len('_scale_factor')]
+        else:
+            continue
+        vd = vs.attach(name)
+        # Each of these Vdata hold a single record with a single value
+        target[variable] = vd.read(nRec=1)[0][0]
+        vd.detach()
+
+    if datafile is not None:
+        vs.end()
+        datafile.close()
+
+    _GRANULE_SCALINGS[key] = offsets, scale_factors
+    while len(_GRANULE_SCALINGS) > GRANULE_SCALINGS_CACHE_SIZE:
+        _GRANULE_SCALINGS.popitem(last=False)
+    return offsets, scale_factors
+
+
+class CloudSatGranule(object):
+    """
+    A read session on a single CloudSat granule. The Vdata and SD interfaces are opened once and every coordinate read
+    through them is memoized until the session is closed.
+    """
+
+    def __init__(self, filename, product):
+        """
+        :param filename: The CloudSat granule to open
+        :param product: The CloudSat_MODIS product used to decode SD variables
+        """
+        from pyhdf.HDF import HDF, HDF4Error
+        from pyhdf.SD import SD
+
+        self.filename = filename
+        self._product = product
+        self._hdf, self._sd = None, None
+        try:
+            self._hdf = HDF(filename)
+            self._sd = SD(filename)
+            self._vs = self._hdf.vstart()
+        except HDF4Error as e:
+            # Don't leak the handles which were opened before the failure
+            if self._sd is not None:
+                self._sd.end()
+            if self._hdf is not None:
+                self._hdf.close()
+            raise IOError(e)
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._vs.end()
+        self._hdf.close()
+        self._sd.end()
+        self._cache.clear()
+
+    def _memoize(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    def vdata(self, variable):
+        """
+        Read the raw values of a Vdata variable
+        """
+        from hdf_vdata import read_vdata
+
+        def _read():
+            vd = self._vs.attach(variable)
+            data = read_vdata(vd)
+            vd.detach()
+            return data
+        return self._memoize(('VD', variable), _read)
+
+    def sds(self, variable):
+        """
+        Read and decode an SD variable, returning the data and its metadata
+        """
+        def _read():
+            sds = self._sd.select(variable)
+            data, attributes = sds.get(), sds.attributes()
+            sds.endaccess()
+            offsets, scale_factors = _get_granule_scalings(self.filename, self._vs)
+            data = self._product._decode_cloudsat_sds(data, attributes, variable, offsets, scale_factors)
+            metadata = Metadata(name=variable, long_name=attributes.get('long_name', ''),
+                                units=attributes.get('units', ''), shape=data.shape,
+                                range=attributes.get('valid_range', None),
+                                missing_value=attributes.get('_FillValue', None), misc=attributes)
+            return data, metadata
+        return self._memoize(('SD', variable), _read)
+
+    @property
+    def latitude(self):
+        return self.sds('MODIS_latitude')
+
+    @property
+    def longitude(self):
+        return self.sds('MODIS_longitude')
+
+    @property
+    def time(self):
+        """
+        The profile times of the granule in CIS standard time
+        """
+        def _read():
+            import datetime as dt
+            from cis.time_util import convert_sec_since_to_std_time
+
+            # Profile_time is stored as float32 seconds since TAI_start, so promote it before adding the start time
+            time = self.vdata('Profile_time').astype('float64') + self.vdata('TAI_start')[0]
+            # Do the conversion to standard time here before we expand the time array...
+            return convert_sec_since_to_std_time(time, dt.datetime(1993, 1, 1, 0, 0, 0))
+        return self._memoize('time', _read)
+
 
 class CloudSat_MODIS(AProduct):
     def get_file_signature(self):
         return [r'.*_CS_.*GRANULE.*\.hdf']
 
-    def get_variable_names(self, filenames, data_type=None):
+    # Set to True to list the variables in every file rather than one file per product/version
+    scan_all_files = False
+
+    @staticmethod
+    def _get_granule_fingerprint(filename):
+        """
+        Identify the product, and product version, of a granule from its filename. Granules which share a fingerprint
+        share a schema. E.g. 2008001005724_08958_CS_2B-GEOPROF_GRANULE_P_R04_E02.hdf -> ('2B-GEOPROF', 'P_R04_E02')
+
+        :param filename: The granule filename
+        :return: A tuple of (product, version), or the filename itself if it doesn't follow the CloudSat convention
+        """
+        import os
+        import re
+        match = re.match(r'.*_CS_(.+)_GRANULE_(.+)\.hdf$', os.path.basename(filename))
+        if match is None:
+            return filename
+        return match.groups()
+
+    def get_variable_names(self, filenames, data_type=None, full_scan=None):
+        """
+        List the Vdata and SD variables available in the files. Only one representative file is opened for each
+        product/version found unless a full scan is requested.
+
+        :param filenames: The files to list
+        :param data_type: Unused
+        :param full_scan: Open every file, defaults to scan_all_files
+        :return: A set of variable names
+        """
         try:
             from pyhdf.SD import SD
             from pyhdf.HDF import HDF
         except ImportError:
             raise ImportError("HDF support was not installed, please reinstall with pyhdf to read HDF files.")
 
+        if full_scan is None:
+            full_scan = self.scan_all_files
+
+        if not full_scan:
+            representatives = {}
+            for filename in filenames:
+                representatives.setdefault(self._get_granule_fingerprint(filename), filename)
+            logging.debug("Listing variables from {} of {} files".format(len(representatives), len(filenames)))
+            filenames = list(representatives.values())
+
         valid_variables = set([])
         for filename in filenames:
             # Do VD variables
@@ -28,6 +225,8 @@ class CloudSat_MODIS(AProduct):
             for var in variables:
                 # if var[3] == dim_length:
                 valid_variables.add(var[0])
+            vdata.end()
+            datafile.close()
 
             # Do SD variables:
             sd = SD(filename)
@@ -37,53 +236,51 @@ class CloudSat_MODIS(AProduct):
             for var in datasets:
                     # if datasets[var][1] == valid_shape:
                 valid_variables.add(var)
+            sd.end()
 
         return valid_variables
 
-    def _generate_time_array(self, vdata):
-        import cis.data_io.hdf_vd as hdf_vd
-        import datetime as dt
-        from cis.time_util import convert_sec_since_to_std_time
+    def _generate_time_array(self, granules):
+        return utils.concatenate([granule.time for granule in granules])
 
-        Cloudsat_start_time = dt.datetime(1993, 1, 1, 0, 0, 0)
-
-        arrays = []
-        for i, j in zip(vdata['Profile_time'], vdata['TAI_start']):
-            time = hdf_vd.get_data(i)
-            start = hdf_vd.get_data(j)
-            time += start
-            # Do the conversion to standard time here before we expand the time array...
-            time = convert_sec_since_to_std_time(time, Cloudsat_start_time)
-            arrays.append(time)
-        return utils.concatenate(arrays)
+    def _create_one_dimensional_coord_list(self, filenames, granules=None):
+        """
+        Create the latitude, longitude and time coordinates
 
-    def _create_one_dimensional_coord_list(self, filenames):
+        :param filenames: The CloudSat granules to read
+        :param granules: Optional open CloudSatGranule sessions for the files, these are used (and left open) if given
+        :return: A CoordList
+        """
         from cis.time_util import cis_standard_time_unit
         # list of coordinate variables we are interested in
         variables = ['MODIS_latitude', 'MODIS_longitude', 'TAI_start', 'Profile_time']
 
         # reading the various files
         logging.info("Listing coordinates: " + str(variables))
-        sdata, vdata = hdf.read(filenames, variables)
+        if granules is None:
+            granules = [CloudSatGranule(f, self) for f in filenames]
+            try:
+                return self._create_one_dimensional_coord_list(filenames, granules)
+            finally:
+                for granule in granules:
+                    granule.close()
 
         # latitude
-        lat = sdata['MODIS_latitude']
-        lat_data = hdf.read_data(lat, self._get_cloudsat_sds_data)
-        lat_metadata = hdf.read_metadata(lat, "SD")
+        lat_data = utils.concatenate([granule.latitude[0] for granule in granules])
+        lat_metadata = granules[0].latitude[1]
         lat_metadata.shape = lat_data.shape
         lat_metadata.standard_name = 'latitude'
         lat_coord = Coord(lat_data, lat_metadata)
 
         # longitude
-        lon = sdata['MODIS_longitude']
-        lon_data = hdf.read_data(lon, self._get_cloudsat_sds_data)
-        lon_metadata = hdf.read_metadata(lon, "SD")
+        lon_data = utils.concatenate([granule.longitude[0] for granule in granules])
+        lon_metadata = granules[0].longitude[1]
         lon_metadata.shape = lon_data.shape
         lon_metadata.standard_name = 'longitude'
         lon_coord = Coord(lon_data, lon_metadata)
 
         # time coordinate
-        time_data = self._generate_time_array(vdata)
+        time_data = self._generate_time_array(granules)
         time_coord = Coord(time_data, Metadata(name='Profile_time', standard_name='time', shape=time_data.shape,
                                                units=cis_standard_time_unit), "X")
 
@@ -96,7 +293,7 @@ class CloudSat_MODIS(AProduct):
         return coords
 
     def create_coords(self, filenames, variable=None):
-        return UngriddedCoordinates(self._create_coord_list(filenames))
+        return UngriddedCoordinates(self._create_one_dimensional_coord_list(filenames))
 
     def create_data_object(self, filenames, variable):
         logging.debug("Creating data object for variable " + variable)
@@ -122,6 +319,7 @@ class CloudSat_MODIS(AProduct):
     def _get_cloudsat_vds_data(self, vds):
         from cis.data_io.hdf_vd import _get_attribute_value, HDF, HDF4Error
         from cis.utils import create_masked_array_for_missing_data
+        from hdf_vdata import read_vdata
         import numpy as np
 
         # get file and variable reference from tuple
@@ -135,10 +333,7 @@ class CloudSat_MODIS(AProduct):
 
         vs = datafile.vstart()
         vd = vs.attach(variable)
-        data = vd.read(nRec=vd.inquire()[0])
-
-        # create numpy array from data
-        data = np.array(data).flatten()
+        data = read_vdata(vd)
 
         missing_value = _get_attribute_value(vd, 'missing', None)
 
@@ -171,12 +366,22 @@ class CloudSat_MODIS(AProduct):
         :param sds: The specific sds instance to read
         :return: A numpy array containing the raw data with missing data is replaced by NaN.
         """
+        offsets, scale_factors = _get_granule_scalings(sds._filename)
+        return self._decode_cloudsat_sds(sds.get(), sds.attributes(), sds._variable, offsets, scale_factors)
+
+    def _decode_cloudsat_sds(self, data, attributes, variable, offsets, scale_factors):
+        """
+        Mask and scale the raw data read from a CloudSat SD variable
+
+        :param data: The raw data array
+        :param attributes: The SD attributes dictionary
+        :param variable: The name of the SD variable
+        :param offsets: Dictionary of the granule's offsets, keyed by variable name
+        :param scale_factors: Dictionary of the granule's scale factors, keyed by variable name
+        :return: A numpy array containing the raw data with missing data is replaced by NaN.
+        """
         from cis.utils import create_masked_array_for_missing_data
         import numpy as np
-        from cis.data_io.hdf_vd import VDS, get_data
-        from pyhdf.error import HDF4Error
-        data = sds.get()
-        attributes = sds.attributes()
 
         # First deal with the Fill value
         fill_value = attributes.get('_FillValue', None)
@@ -204,7 +409,7 @@ class CloudSat_MODIS(AProduct):
                 data = missop_fn[missop](data, missing)
             except KeyError:
                 logging.warning("Unable to identify missop {}, unable to "
-                                "mask missing values for {}.".format(missop, sds.info()[0]))
+                                "mask missing values for {}.".format(missop, variable))
 
         # Now handle valid range mask
         valid_range = attributes.get('valid_range', None)
@@ -215,14 +420,14 @@ class CloudSat_MODIS(AProduct):
 
         # Offsets and scaling - these come from Vdata variables with the appropraite suffixes
         try:
-            offset = get_data(VDS(sds._filename, sds._variable + "_add_offset"))[0]
-        except HDF4Error:
-            print("WARNING: Couldn't find offset variable " + sds._variable + "_add_offset")
+            offset = offsets[variable]
+        except KeyError:
+            logging.warning("Couldn't find offset variable " + variable + "_add_offset")
             offset = 0
         try:
-            scale_factor = get_data(VDS(sds._filename, sds._variable + "_scale_factor"))[0]
-        except HDF4Error:
-            print("WARNING: Couldn't find scale factor variable " + sds._variable + "_scale_factor")
+            scale_factor = scale_factors[variable]
+        except KeyError:
+            logging.warning("Couldn't find scale factor variable " + variable + "_scale_factor")
             scale_factor = 1
 
         data = self._apply_scaling_factor_CLOUDSAT(data, scale_factor, offset)
@@ -0,0 +1,144 @@
+import logging
+import os
+from collections import OrderedDict
+
+# The default number of bytes the cached cubes may hold before the least recently used are evicted
+CUBE_CACHE_BYTES = int(os.environ.get('CIS_CUBE_CACHE_BYTES', 2 * 1024 ** 3))
+
+
+def _get_callback_identity(callback):
+    """
+    Identify a load callback by name rather than id, so that the (static) callbacks of different product instances
+    share cache entries
+    """
+    if callback is None:
+        return None
+    return getattr(callback, '__module__', None), getattr(callback, '__qualname__', repr(callback))
+
+
+def _get_cube_nbytes(cube):
+    """
+    Estimate the memory used by a cube: its data and coordinate points and bounds, if they have been realised
+    """
+    nbytes = 0 if cube.has_lazy_data() else cube.data.nbytes
+    for coord in cube.coords():
+        if not getattr(coord, 'has_lazy_points', lambda: False)():
+            nbytes += coord.points.nbytes
+        if coord.has_bounds() and not getattr(coord, 'has_lazy_bounds', lambda: False)():
+            nbytes += coord.bounds.nbytes
+    return nbytes
+
+
+class CubeCache(object):
+    """
+    A least-recently-used cache of the raw cubes loaded from sets of files. Entries are keyed by the files' paths,
+    modification times and sizes, the identity of the load callback and the variables loaded (if they were
+    restricted), so rewritten files are never served stale.
+    The memory used by the cubes is re-measured whenever they're accessed (as lazy data may since have been realised)
+    and the least recently used entries are evicted to keep it within max_bytes.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = CUBE_CACHE_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def get_key(filenames, callback=None, variables=None):
+        files = []
+        for filename in filenames:
+            stat = os.stat(filename)
+            files.append((os.path.abspath(filename), stat.st_mtime, stat.st_size))
+        return tuple(files), _get_callback_identity(callback), tuple(variables) if variables is not None else None
+
+    @property
+    def nbytes(self):
+        return sum(self._nbytes.values())
+
+    def get_cubes(self, filenames, callback, load, variables=None):
+        """
+        Get the cubes for a set of files from the cache, loading them if they aren't there (or are out of date)
+
+        :param filenames: The files to load
+        :param callback: The load callback
+        :param load: A function taking the filenames, callback and variables and returning a CubeList
+        :param variables: The (NetCDF) variables to load, or None for all of them
+        :return: The CubeList
+        """
+        key = self.get_key(filenames, callback, variables)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            # Drop any entries for older versions of the same files
+            paths = [f[0] for f in key[0]]
+            for stale in [k for k in self._entries if [f[0] for f in k[0]] == paths and k[0] != key[0]]:
+                self._remove(stale)
+            self._entries[key] = load(filenames, callback, variables)
+        cubes = self._entries[key]
+        self._nbytes[key] = sum(_get_cube_nbytes(cube) for cube in cubes)
+        self._evict(key)
+        return cubes
+
+    def get_array(self, filenames, name, compute):
+        """
+        Get an array derived from a set of files from the cache, computing it if it isn't there (or is out of date).
+        These share the memory budget (and LRU order) with the cubes.
+
+        :param filenames: The files the array was derived from
+        :param name: A (hashable) name for the array, which should include anything else it depends on
+        :param compute: A function taking no arguments and returning the array
+        :return: The array
+        """
+        key = self.get_key(filenames)[0], 'array', name
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            self._entries[key] = compute()
+        array = self._entries[key]
+        self._nbytes[key] = array.nbytes
+        self._evict(key)
+        return array
+
+    def _remove(self, key):
+        del self._entries[key]
+        del self._nbytes[key]
+
+    def _evict(self, current):
+        total = self.nbytes
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == current and len(self._entries) > 1:
+                continue
+            total -= self._nbytes[key]
+            self._remove(key)
+            self.evictions += 1
+            logging.debug("Evicted cached cubes for {}".format([f[0] for f in key[0]]))
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes.clear()
+
+    def stats(self):
+        """
+        :return: A dictionary of the cache hits, misses, evictions, number of entries and memory used
+        """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, entries=len(self._entries),
+                    nbytes=self.nbytes, max_bytes=self.max_bytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+# The cache shared by all of the plugins
+CUBE_CACHE = CubeCache()
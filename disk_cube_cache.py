@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+
+# Optional directory to keep an on-disk cache of the gridded data objects in, so that they can be reused by later
+#  processes (e.g. separate cis invocations). The cache is disabled unless this (or a product's cube_cache_dir) is set.
+DISK_CACHE_DIR = os.environ.get('CIS_CUBE_DISK_CACHE_DIR', None)
+
+# The number of bytes the on-disk cache may hold before the least recently used entries are removed
+DISK_CACHE_BYTES = int(os.environ.get('CIS_CUBE_DISK_CACHE_BYTES', 20 * 1024 ** 3))
+
+# Bump this to invalidate every existing entry if the way they're written changes
+_CACHE_VERSION = 1
+
+
+def get_disk_cache_dir(product):
+    """
+    :return: The on-disk cache directory configured for a product, or None if it isn't using one
+    """
+    cache_dir = getattr(product, 'cube_cache_dir', None)
+    return cache_dir if cache_dir is not None else DISK_CACHE_DIR
+
+
+def _get_product_settings(product):
+    """
+    Get the (public, non-callable) configuration attributes of a product, which may change the cubes it creates
+    """
+    settings = {}
+    for name in dir(product):
+        if not name.startswith('_') and name != 'cube_cache_dir':
+            value = getattr(product, name)
+            if not callable(value):
+                settings[name] = repr(value)
+    return settings
+
+
+def get_disk_cache_manifest(product, filenames, variable):
+    """
+    Describe a data object by everything it depends on: the product (and its settings), the variable and the path,
+    modification time and size of each file it was read from
+
+    :return: The manifest dictionary, or None if the variable can't be identified (e.g. a constraint with only a cube
+     function), in which case it can't be cached
+    """
+    if variable is not None and not isinstance(variable, str):
+        variable = getattr(variable, 'display', None)
+        if variable == 'None':
+            variable = None
+    if variable is None:
+        return None
+    files = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        files.append([os.path.abspath(filename), stat.st_mtime, stat.st_size])
+    return dict(version=_CACHE_VERSION, product='{}.{}'.format(type(product).__module__, type(product).__name__),
+                settings=_get_product_settings(product), variable=variable, files=files)
+
+
+def _get_entry_filenames(cache_dir, manifest):
+    key = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.nc'), os.path.join(cache_dir, key + '.json')
+
+
+def _materialize_derived_coords(cube):
+    """
+    Replace a cube's aux factories with the (real) aux coords they derive, so that they're saved with the cube and
+    don't need recomputing when it's loaded again
+    """
+    from iris.coords import AuxCoord
+
+    for factory in list(cube.aux_factories):
+        coord = cube.coord(factory.name())
+        dims = cube.coord_dims(coord)
+        cube.remove_aux_factory(factory)
+        cube.add_aux_coord(AuxCoord.from_coord(coord), dims)
+
+
+def _read_entry(data_filename, manifest_filename, manifest):
+    import iris
+    import cis.data_io.gridded_data as gd
+
+    with open(manifest_filename) as f:
+        if json.load(f) != json.loads(json.dumps(manifest)):
+            return None
+    # Mark the entry as recently used
+    os.utime(manifest_filename)
+    # The data (and coordinates) are read lazily from the cached file, so only what's used is ever read
+    return gd.make_from_cube(iris.load_cube(data_filename))
+
+
+def _write_entry(data, data_filename, manifest_filename, manifest):
+    """
+    Write an entry to temporary files first, so other processes never see a partially written one. The manifest is
+    written last as it marks the entry as complete.
+    """
+    import iris
+
+    cube = data.copy()
+    _materialize_derived_coords(cube)
+    # Keep the extensions on the temporary files, iris picks the saver from it
+    tmp_data_filename = '{}.{}.tmp.nc'.format(data_filename[:-len('.nc')], os.getpid())
+    tmp_manifest_filename = '{}.{}.tmp.json'.format(manifest_filename[:-len('.json')], os.getpid())
+    try:
+        iris.save(cube, tmp_data_filename, netcdf_format='NETCDF4')
+        os.replace(tmp_data_filename, data_filename)
+        with open(tmp_manifest_filename, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest_filename, manifest_filename)
+    finally:
+        for filename in (tmp_data_filename, tmp_manifest_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+def prune_disk_cache(cache_dir, max_bytes=None):
+    """
+    Remove the least recently used entries from an on-disk cache until it's within max_bytes
+
+    :param cache_dir: The cache directory
+    :param max_bytes: The maximum size of the cache, defaults to DISK_CACHE_BYTES
+    """
+    max_bytes = DISK_CACHE_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.json') and not entry.name.endswith('.tmp.json'):
+            data_filename = entry.path[:-len('.json')] + '.nc'
+            size = os.path.getsize(data_filename) if os.path.exists(data_filename) else 0
+            entries.append((entry.stat().st_mtime, size, data_filename, entry.path))
+    total = sum(e[1] for e in entries)
+    for _, size, data_filename, manifest_filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        for filename in (manifest_filename, data_filename):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        total -= size
+
+
+def load_cached_data_object(product, filenames, variable, create):
+    """
+    Get a gridded data object from the on-disk cache, creating (and caching) it if it isn't there or its files have
+    changed. Derived coordinates (e.g. air pressure) are stored as real coordinates. If the product isn't using a cache
+    the data object is just created.
+
+    :param product: The product instance reading the files
+    :param filenames: The files to read
+    :param variable: The variable to read
+    :param create: A function taking the filenames and variable and returning the data object
+    :return: The GriddedData object
+    """
+    from iris.exceptions import IrisError
+
+    cache_dir = get_disk_cache_dir(product)
+    manifest = get_disk_cache_manifest(product, filenames, variable) if cache_dir is not None else None
+    if manifest is None:
+        return create(filenames, variable)
+
+    data_filename, manifest_filename = _get_entry_filenames(cache_dir, manifest)
+    if os.path.exists(manifest_filename):
+        try:
+            data = _read_entry(data_filename, manifest_filename, manifest)
+            if data is not None:
+                logging.debug("Read {} from the cube cache {}".format(variable, data_filename))
+                return data
+        except (IOError, OSError, ValueError, IrisError) as e:
+            logging.warning("Unable to read the cached cube {}, re-reading the files: {}".format(data_filename, e))
+
+    data = create(filenames, variable)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_entry(data, data_filename, manifest_filename, manifest)
+        prune_disk_cache(cache_dir)
+    except (IOError, OSError, ValueError, IrisError) as e:
+        logging.warning("Unable to write {} to the cube cache {}: {}".format(variable, cache_dir, e))
+    return data
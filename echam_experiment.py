@@ -0,0 +1,101 @@
+import os
+import re
+
+# ECHAM-HAM output files are named <experiment>_<date>[.<part>]_<stream>.nc, e.g. 'myexp_200301.01_vphyscm.nc'
+_STREAM_FILENAME = re.compile(r'^(?P<prefix>.+)_(?P<stream>[^_]+)\.nc$')
+
+# The streams to look in first for shared fields (such as the surface pressure), before any others
+PREFERRED_STREAMS = ('vphyscm', 'echam', 'ham', 'tracerm')
+
+# The index of each directory scanned, keyed by path, with the directory modification time it was built at
+_INDICES = {}
+
+
+def split_stream_filename(filename):
+    """
+    :param filename: An ECHAM-HAM output file
+    :return: A tuple of the file's prefix (experiment and date) and stream name, or None if it isn't named like one
+    """
+    match = _STREAM_FILENAME.match(os.path.basename(filename))
+    if match is None:
+        return None
+    return match.group('prefix'), match.group('stream')
+
+
+def get_experiment_index(directory):
+    """
+    Map each experiment date (file prefix) in a directory to the files of each of its streams, from a single scan of
+    the directory. The result is memoized until the directory is modified.
+
+    :param directory: The experiment output directory
+    :return: A dictionary of {stream: filename} dictionaries, keyed by prefix
+    """
+    directory = os.path.abspath(directory)
+    mtime = os.stat(directory).st_mtime
+    if directory not in _INDICES or _INDICES[directory][0] != mtime:
+        index = {}
+        for entry in os.scandir(directory):
+            parts = split_stream_filename(entry.name)
+            if parts is not None and entry.is_file():
+                index.setdefault(parts[0], {})[parts[1]] = entry.path
+        _INDICES[directory] = mtime, index
+    return _INDICES[directory][1]
+
+
+def get_companion_files(filenames, stream):
+    """
+    Find the files of another stream written for the same dates as the given files
+
+    :param filenames: The ECHAM-HAM output files
+    :param stream: The stream to find, e.g. 'vphyscm'
+    :return: A list of the companion files (one per file), or None if any of them don't exist
+    """
+    companions = []
+    for filename in filenames:
+        parts = split_stream_filename(filename)
+        if parts is None:
+            return None
+        companion = get_experiment_index(os.path.dirname(filename) or os.curdir).get(parts[0], {}).get(stream, None)
+        if companion is None:
+            return None
+        companions.append(companion)
+    return companions
+
+
+def get_companion_streams(filenames):
+    """
+    List the other streams available for every one of the given files' dates, preferred streams first
+
+    :param filenames: The ECHAM-HAM output files
+    :return: A list of stream names
+    """
+    streams = None
+    own_streams = set()
+    for filename in filenames:
+        parts = split_stream_filename(filename)
+        if parts is None:
+            return []
+        own_streams.add(parts[1])
+        available = set(get_experiment_index(os.path.dirname(filename) or os.curdir).get(parts[0], {}))
+        streams = available if streams is None else streams & available
+    streams = (streams or set()) - own_streams
+    return [s for s in PREFERRED_STREAMS if s in streams] + sorted(streams.difference(PREFERRED_STREAMS))
+
+
+def find_companion_files(filenames, name):
+    """
+    Find the companion stream files which contain a variable, checking only the file headers so no trial loads are
+    needed
+
+    :param filenames: The ECHAM-HAM output files
+    :param name: The variable name, standard name or long name to look for
+    :return: A list of the companion files (one per file) of the first stream containing the variable, or None if
+     there aren't any
+    """
+    from netcdf_header import find_matching_variables
+
+    for stream in get_companion_streams(filenames):
+        companions = get_companion_files(filenames, stream)
+        if companions is not None and find_matching_variables(companions[:1], name):
+            return companions
+    return None
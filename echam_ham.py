@@ -1,5 +1,14 @@
-from echam_ham_pascals import ECHAM_HAM_Pascals
-from cis.utils import demote_warnings
+from echam_ham_pascals import ECHAM_HAM_Pascals, _get_surface_pressure_from_interfaces, _get_cubes
+
+
+def _get_horizontal_and_time_dims(cube):
+    """
+    Get the dimensions of a cube other than the model level (if it has one), which a surface field spans
+    """
+    level_dims = set()
+    for coord in cube.coords(long_name='hybrid level at layer midpoints'):
+        level_dims.update(cube.coord_dims(coord))
+    return tuple(d for d in range(cube.ndim) if d not in level_dims)
 
 
 class ECHAM_HAM(ECHAM_HAM_Pascals):
@@ -10,9 +19,7 @@ class ECHAM_HAM(ECHAM_HAM_Pascals):
 
     def _add_available_aux_coords(self, cube, filenames):
         from iris.aux_factory import HybridPressureFactory
-        from iris.coords import AuxCoord
         from iris.exceptions import CoordinateNotFoundError
-        import iris
 
         if cube.coords('hybrid A coefficient at layer midpoints'):
 
@@ -21,14 +28,12 @@ class ECHAM_HAM(ECHAM_HAM_Pascals):
 
             try:
                 surface_pressure = cube.coord('surface pressure')
-            except iris.exceptions.CoordinateNotFoundError as e:
+            except CoordinateNotFoundError:
                 # If there isn't a surface pressure coordinate we can try and pull out the lowest pressure level
-                with demote_warnings():
-                    surface_pressure_cubes = iris.load(filenames, 'atmospheric pressure at interfaces',
-                                                       callback=self.load_multiple_files_callback)
-                surface_pressure_cube = surface_pressure_cubes.concatenate_cube()[:, -1, :, :]
-                surface_pressure = AuxCoord(points=surface_pressure_cube.data, long_name='surface pressure', units='Pa')
-                cube.add_aux_coord(surface_pressure, (0, 2, 3))
+                surface_pressure = _get_surface_pressure_from_interfaces(
+                    _get_cubes(filenames, 'atmospheric pressure at interfaces',
+                               callback=self.load_multiple_files_callback))
+                cube.add_aux_coord(surface_pressure, _get_horizontal_and_time_dims(cube))
  
             surface_pressure.convert_units('hPa')
  
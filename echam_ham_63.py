@@ -1,21 +1,23 @@
-from echam_ham_pascals import ECHAM_HAM_Pascals
+from echam_ham_pascals import ECHAM_HAM_Pascals, _get_surface_pressure_from_interfaces, _merge_cubes
 import cis.data_io.gridded_data as gd
-import logging
 from cis.utils import demote_warnings
+from cube_cache import CUBE_CACHE
+from netcdf_header import get_constrained_variables, load_raw_variables
+
+
+def _load_raw_cubes(filenames, callback=None, variables=None):
+    with demote_warnings():
+        return load_raw_variables(filenames, variables, callback=callback)
 
 
 def _get_cubes(filenames, constraints=None, callback=None):
-    import iris
+    from iris.cube import CubeList
 
-    filenames_key = tuple(filenames)
-    if filenames_key in gd.CACHED_CUBES:
-        all_cubes = gd.CACHED_CUBES[filenames_key]
-        # print("Reading cached files: {}".format(filenames_key))
-    else:
-        with demote_warnings():
-            all_cubes = iris.load_raw(filenames, callback=callback)
-        gd.CACHED_CUBES[filenames_key] = all_cubes
-        # print("Caching files: {}".format(filenames_key))
+    # Only load (and cache) the variables the constraint could select, rather than every variable in the files
+    variables = get_constrained_variables(filenames, constraints)
+    if variables is not None and len(variables) == 0:
+        return CubeList()
+    all_cubes = gd.CACHED_CUBES.get_cubes(filenames, callback, _load_raw_cubes, variables)
     if constraints is not None:
         cubes = all_cubes.extract(constraints=constraints)
     else:
@@ -24,23 +26,33 @@ def _get_cubes(filenames, constraints=None, callback=None):
 
 
 def load_from_cached_cubes(filenames, constraints=None, callback=None):
-    from iris.exceptions import MergeError, ConcatenateError
-    cubes = _get_cubes(filenames, constraints, callback)
+    return _merge_cubes(_get_cubes(filenames, constraints, callback), constraints)
 
-    try:
-        iris_cube = cubes.merge_cube()
-    except MergeError as e:
-        logging.info("Unable to merge cubes on load: \n {}\nAttempting to concatenate instead.".format(e))
-        try:
-            iris_cube = cubes.concatenate_cube()
-        except ConcatenateError as e:
-            logging.error("Unable to concatenate cubes on load: \n {}".format(e))
-            raise ValueError("Unable to create a single cube from arguments given: {}".format(constraints))
-    except ValueError as e:
-        raise ValueError("No cubes found")
-    return gd.make_from_cube(iris_cube)
-
-gd.CACHED_CUBES = {}
+
+def _get_companion_surface_pressure(filenames, callback=None):
+    """
+    Get the surface pressure from whichever companion stream of the files holds it (or the atmospheric pressure at
+    interfaces), using the experiment index rather than trying to load each candidate
+
+    :return: A surface_air_pressure AuxCoord, or None if no companion stream has it
+    """
+    from iris.coords import AuxCoord
+    from echam_experiment import find_companion_files
+
+    companion_files = find_companion_files(filenames, 'surface_air_pressure')
+    if companion_files is not None:
+        surface_pressure_cube = _get_cubes(companion_files, 'surface_air_pressure',
+                                           callback=callback).concatenate_cube()
+        return AuxCoord(points=surface_pressure_cube.data, standard_name='surface_air_pressure',
+                        long_name='surface pressure', units='Pa')
+    companion_files = find_companion_files(filenames, 'atmospheric pressure at interfaces')
+    if companion_files is not None:
+        return _get_surface_pressure_from_interfaces(
+            _get_cubes(companion_files, 'atmospheric pressure at interfaces', callback=callback))
+    return None
+
+
+gd.CACHED_CUBES = CUBE_CACHE
 gd.load_cube = load_from_cached_cubes
 
 
@@ -52,32 +64,11 @@ class ECHAM_HAM_63(ECHAM_HAM_Pascals):
 
     def get_variable_names(self, filenames, data_type=None):
         """
-        This is exactly the same as the inherited version except I also exclude the mlev dimension
+        This is exactly the same as the inherited version except I also exclude the lev dimension. Only the header
+        of the first file is read (the files are assumed to be a homogeneous series), so no cubes are loaded.
         """
-        import iris
-        import cf_units as unit
-        variables = []
-
-        cubes = _get_cubes(filenames, callback=self.load_multiple_files_callback)
-
-        for cube in cubes:
-            is_time_lat_lon_pressure_altitude_or_has_only_1_point = True
-            for dim in cube.dim_coords:
-                units = dim.units
-                if dim.points.size > 1 and \
-                        not units.is_time() and \
-                        not units.is_time_reference() and \
-                        not units.is_vertical() and \
-                        not units.is_convertible(unit.Unit('degrees')) and \
-                        dim.var_name != 'lev':
-                    is_time_lat_lon_pressure_altitude_or_has_only_1_point = False
-                    break
-            if is_time_lat_lon_pressure_altitude_or_has_only_1_point:
-                if cube.var_name:
-                    variables.append(cube.var_name)
-                else:
-                    variables.append(cube.name())
-        return set(variables)
+        from netcdf_header import get_gridded_variable_names
+        return get_gridded_variable_names(filenames[:1], allowed_dimensions=('lev',))
 
     def _add_available_aux_coords(self, cube, filenames):
         import iris
@@ -88,8 +79,10 @@ class ECHAM_HAM_63(ECHAM_HAM_Pascals):
         # Only do this for fields with a vertical component - this check is a bit hacky though (doesn't consider 3D with no time...)
         if cube.ndim == 4:
             # Only read the first file for these coefficients as they are time-independant and iris won't merge them
-            hybrid_a = _get_cubes(filenames, 'hybrid A coefficient at layer midpoints')
-            hybrid_b = _get_cubes(filenames, 'hybrid B coefficient at layer midpoints')
+            hybrid_a = _get_cubes(filenames, 'hybrid A coefficient at layer midpoints',
+                                  callback=self.load_multiple_files_callback)
+            hybrid_b = _get_cubes(filenames, 'hybrid B coefficient at layer midpoints',
+                                  callback=self.load_multiple_files_callback)
 
             if not hybrid_a:
                 # This might be an afterburned cube, eitherway we can't do anything with it
@@ -118,20 +111,14 @@ class ECHAM_HAM_63(ECHAM_HAM_Pascals):
                         # If there isn't a surface pressure coordinate we can try and pull out the lowest pressure level
                         surface_pressure_cubes = _get_cubes(filenames, 'atmospheric pressure at interfaces',
                                                             callback=self.load_multiple_files_callback)
-                        surface_pressure_cube = surface_pressure_cubes.concatenate_cube()[:,-1,:,:]
-                        surface_pressure = AuxCoord(points=surface_pressure_cube.data, long_name='surface pressure', units='Pa')
+                        surface_pressure = _get_surface_pressure_from_interfaces(surface_pressure_cubes)
                         cube.add_aux_coord(surface_pressure, (0, 2, 3))
                     except ValueError:
-                        # Try and get it from the vphysc stream
-                        v_files = ['_'.join(f.split('_')[:-1]) + '_vphyscm.nc' for f in filenames]
-                        try:
-                            surface_pressure_cubes = _get_cubes(v_files, 'atmospheric pressure at interfaces',
-                                                                callback=self.load_multiple_files_callback)
-                        except:
-                            # If we can't do that then just exit - there must be a cleaner way to do this...
+                        # Try and get it from a companion stream (e.g. vphyscm) written for the same dates
+                        surface_pressure = _get_companion_surface_pressure(filenames,
+                                                                           self.load_multiple_files_callback)
+                        if surface_pressure is None:
                             return
-                        surface_pressure_cube = surface_pressure_cubes.concatenate_cube()[:,-1,:,:]
-                        surface_pressure = AuxCoord(points=surface_pressure_cube.data, long_name='surface pressure', units='Pa')
                         cube.add_aux_coord(surface_pressure, (0, 2, 3))
 
             # First convert the hybrid coefficients to hPa, so that air pressure will be in hPa
@@ -2,23 +2,28 @@ from cis.data_io.products import NetCDF_Gridded
 import cis.data_io.gridded_data as gd
 import logging
 from cis.utils import demote_warnings
+from cube_cache import CUBE_CACHE
+from netcdf_header import get_constrained_variables, load_raw_variables
 
 
-def _get_cubes(filenames, constraints=None, callback=None):
+def _load_raw_cubes(filenames, callback=None, variables=None):
     import iris
 
     # Removes warnings and prepares for future Iris change
     iris.FUTURE.netcdf_promote = True
 
-    filenames_key = tuple(filenames)
-    if filenames_key in gd.CACHED_CUBES:
-        all_cubes = gd.CACHED_CUBES[filenames_key]
-        # print("Reading cached files: {}".format(filenames_key))
-    else:
-        with demote_warnings():
-            all_cubes = iris.load_raw(filenames, callback=callback)
-        gd.CACHED_CUBES[filenames_key] = all_cubes
-        # print("Caching files: {}".format(filenames_key))
+    with demote_warnings():
+        return load_raw_variables(filenames, variables, callback=callback)
+
+
+def _get_cubes(filenames, constraints=None, callback=None):
+    from iris.cube import CubeList
+
+    # Only load (and cache) the variables the constraint could select, rather than every variable in the files
+    variables = get_constrained_variables(filenames, constraints)
+    if variables is not None and len(variables) == 0:
+        return CubeList()
+    all_cubes = gd.CACHED_CUBES.get_cubes(filenames, callback, _load_raw_cubes, variables)
     if constraints is not None:
         cubes = all_cubes.extract(constraints=constraints)
     else:
@@ -27,8 +32,23 @@ def _get_cubes(filenames, constraints=None, callback=None):
 
 
 def load_from_cached_cubes(filenames, constraints=None, callback=None):
+    return _merge_cubes(_get_cubes(filenames, constraints, callback), constraints)
+
+
+def _merge_cubes(cubes, constraints=None):
+    """
+    Merge (or failing that concatenate) the cubes read from a set of files into a single GriddedData object
+    """
     from iris.exceptions import MergeError, ConcatenateError
-    cubes = _get_cubes(filenames, constraints, callback)
+
+    if len(cubes) > 1 and all(cube.coords('time', dim_coords=True) for cube in cubes):
+        # The cubes (e.g. one per monthly file) already have a time dimension, so they can only be joined along it -
+        #  concatenate them straight away rather than trying to merge them first
+        try:
+            return gd.make_from_cube(cubes.concatenate_cube())
+        except ConcatenateError as e:
+            logging.info("Unable to concatenate cubes along time on load: \n {}\n"
+                         "Attempting to merge instead.".format(e))
 
     try:
         iris_cube = cubes.merge_cube()
@@ -43,12 +63,109 @@ def load_from_cached_cubes(filenames, constraints=None, callback=None):
         raise ValueError("No cubes found")
     return gd.make_from_cube(iris_cube)
 
+gd.CACHED_CUBES = CUBE_CACHE
+
+
+def _get_surface_pressure_from_interfaces(interface_cubes):
+    """
+    Create a surface pressure coordinate from the lowest level of the (raw, per-file) cubes of atmospheric pressure
+    at interfaces. Each cube is sliced before they're concatenated, so only the bottom level is ever read from the
+    files, and the points are left lazy where Iris supports it.
+    """
+    from iris.coords import AuxCoord
+    from iris.cube import CubeList
+
+    surface_pressure_cube = CubeList([c[:, -1, :, :] for c in interface_cubes]).concatenate_cube()
+    if hasattr(surface_pressure_cube, 'core_data'):
+        points = surface_pressure_cube.core_data()
+    else:
+        points = surface_pressure_cube.data
+    return AuxCoord(points=points, long_name='surface pressure', units='Pa')
+
+
+# The number of time steps of air pressure to compute at a time when materializing it
+AIR_PRESSURE_CHUNK_SIZE = 12
+
+
+def _get_chunk(cube, coord, chunk_dim, start, stop):
+    """
+    Read a chunk of a coordinate's points along a cube dimension, shaped to broadcast against the whole cube
+    """
+    import numpy as np
+
+    coord_dims = cube.coord_dims(coord)
+    points = coord.core_points() if hasattr(coord, 'core_points') else coord.points
+    points = np.asarray(points[tuple(slice(start, stop) if d == chunk_dim else slice(None) for d in coord_dims)])
+    shape = [1] * cube.ndim
+    for i, d in enumerate(coord_dims):
+        shape[d] = points.shape[i]
+    return points.reshape(shape)
+
+
+def _materialize_air_pressure(cube, filenames, dtype=None, chunk_size=None):
+    """
+    Replace a cube's hybrid pressure factory with a real air pressure coordinate, so Iris doesn't recompute the full
+    derived coordinate every time it's accessed. The air pressure is computed a few time steps at a time and kept in
+    the cube cache, so other variables from the same files reuse it.
+
+    :param cube: The cube with a HybridPressureFactory
+    :param filenames: The files the cube was read from
+    :param dtype: The dtype to store the air pressure as (e.g. 'float32'), defaults to that of the surface pressure
+    :param chunk_size: The number of time steps to compute at a time, defaults to AIR_PRESSURE_CHUNK_SIZE
+    """
+    import numpy as np
+    from iris.aux_factory import HybridPressureFactory
+    from iris.coords import AuxCoord
+
+    factories = [f for f in cube.aux_factories if isinstance(f, HybridPressureFactory)]
+    if not factories:
+        return
+    factory = factories[0]
+    delta, sigma, surface_pressure = [factory.dependencies[name] for name in
+                                      ('delta', 'sigma', 'surface_air_pressure')]
+
+    dims = sorted(set(cube.coord_dims(delta) + cube.coord_dims(sigma) + cube.coord_dims(surface_pressure)))
+    shape = tuple(cube.shape[d] for d in dims)
+    # Compute in chunks along the first surface pressure dimension (time)
+    chunk_dim = cube.coord_dims(surface_pressure)[0]
+    chunk_size = chunk_size or AIR_PRESSURE_CHUNK_SIZE
+    dtype = np.dtype(dtype or surface_pressure.dtype)
+
+    def compute():
+        air_pressure = np.empty(shape, dtype=dtype)
+        for start in range(0, cube.shape[chunk_dim], chunk_size):
+            stop = min(start + chunk_size, cube.shape[chunk_dim])
+            chunk = _get_chunk(cube, delta, chunk_dim, start, stop) + \
+                _get_chunk(cube, sigma, chunk_dim, start, stop) * _get_chunk(cube, surface_pressure, chunk_dim, start,
+                                                                            stop)
+            chunk = np.broadcast_to(chunk, tuple(stop - start if d == chunk_dim else cube.shape[d]
+                                                 for d in range(cube.ndim)))
+            index = tuple(slice(start, stop) if d == chunk_dim else slice(None) for d in dims)
+            air_pressure[index] = chunk.reshape([chunk.shape[d] for d in dims])
+        return air_pressure
+
+    name = ('air_pressure', str(dtype), str(delta.units), shape)
+    points = CUBE_CACHE.get_array(filenames, name, compute)
+
+    cube.remove_aux_factory(factory)
+    cube.add_aux_coord(AuxCoord(points, standard_name='air_pressure', long_name='air pressure', var_name='air_pressure',
+                                units=delta.units), dims)
+
 
 class ECHAM_HAM_Pascals(NetCDF_Gridded):
     """
         Plugin for reading ECHAM-HAM NetCDF output files.
     """
 
+    # Compute the 3-D air pressure once per set of files and store it as a real coordinate, rather than as a derived
+    #  (hybrid pressure) coordinate which Iris recomputes whenever it's accessed
+    materialize_air_pressure = False
+    # The dtype to store the materialized air pressure as, e.g. 'float32' to halve its size
+    air_pressure_dtype = None
+    # Directory of an on-disk cache of the created data objects shared between processes, defaults to
+    #  CIS_CUBE_DISK_CACHE_DIR (if that isn't set either the cache isn't used)
+    cube_cache_dir = None
+
     @staticmethod
     def load_single_file_callback(cube, field, filename):
         from iris.util import squeeze
@@ -66,52 +183,50 @@ class ECHAM_HAM_Pascals(NetCDF_Gridded):
 
     def get_variable_names(self, filenames, data_type=None):
         """
-        This is exactly the same as the inherited version except I also exclude the mlev dimension
+        This is exactly the same as the inherited version except I also exclude the mlev dimension. Only the header
+        of the first file is read (the files are assumed to be a homogeneous series), so no cubes are loaded.
         """
-        import iris
-        import cf_units as unit
-        variables = []
-
-        cubes = _get_cubes(filenames, callback=self.load_multiple_files_callback)
-
-        for cube in cubes:
-            is_time_lat_lon_pressure_altitude_or_has_only_1_point = True
-            for dim in cube.dim_coords:
-                units = dim.units
-                if dim.points.size > 1 and \
-                        not units.is_time() and \
-                        not units.is_time_reference() and \
-                        not units.is_vertical() and \
-                        not units.is_convertible(unit.Unit('degrees')) and \
-                        dim.var_name != 'mlev':
-                    is_time_lat_lon_pressure_altitude_or_has_only_1_point = False
-                    break
-            if is_time_lat_lon_pressure_altitude_or_has_only_1_point:
-                if cube.var_name:
-                    variables.append(cube.var_name)
-                else:
-                    variables.append(cube.name())
-
-        return set(variables)
+        from netcdf_header import get_gridded_variable_names
+        return get_gridded_variable_names(filenames[:1], allowed_dimensions=('mlev',))
 
     def get_file_signature(self):
         return [r'.*\.nc']
 
+    def create_data_object(self, filenames, variable):
+        from disk_cube_cache import load_cached_data_object
+        return load_cached_data_object(self, filenames, variable,
+                                       super(ECHAM_HAM_Pascals, self).create_data_object)
+
+    def reduce_over_time(self, filenames, variable, statistic='mean', group_by=None):
+        """
+        Calculate a statistic of a variable over time, or for each month or season of the year, reading one file at a
+        time rather than creating the whole time series
+
+        :param filenames: The files of the time series
+        :param variable: The variable name
+        :param statistic: One of 'mean', 'sum', 'min', 'max' or 'count'
+        :param group_by: None, 'month' or 'season'
+        :return: A GriddedData object
+        """
+        from temporal_reduction import reduce_files_over_time
+        return reduce_files_over_time(self, filenames, variable, statistic, group_by)
+
+    def _create_cube(self, filenames, variable):
+        cube = super(ECHAM_HAM_Pascals, self)._create_cube(filenames, variable)
+        if self.materialize_air_pressure:
+            _materialize_air_pressure(cube, filenames, self.air_pressure_dtype)
+        return cube
+
     def _add_available_aux_coords(self, cube, filenames):
         from iris.aux_factory import HybridPressureFactory
-        from iris.coords import AuxCoord
         from iris.exceptions import CoordinateNotFoundError
-        import iris
 
         try:
             surface_pressure = cube.coord('surface pressure')
-        except iris.exceptions.CoordinateNotFoundError as e:
+        except CoordinateNotFoundError:
             # If there isn't a surface pressure coordinate we can try and pull out the lowest pressure level
-            with demote_warnings():
-                surface_pressure_cubes = iris.load(filenames, 'atmospheric pressure at interfaces',
-                                                   callback=self.load_multiple_files_callback)
-            surface_pressure_cube = surface_pressure_cubes.concatenate_cube()[:, -1, :, :]
-            surface_pressure = AuxCoord(points=surface_pressure_cube.data, long_name='surface pressure', units='Pa')
+            surface_pressure = _get_surface_pressure_from_interfaces(
+                _get_cubes(filenames, 'atmospheric pressure at interfaces', callback=self.load_multiple_files_callback))
             cube.add_aux_coord(surface_pressure, (0, 2, 3))
 
         if len(cube.coords(long_name='hybrid level at layer midpoints')) > 0:
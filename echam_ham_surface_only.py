@@ -1,12 +1,48 @@
 from echam_ham import ECHAM_HAM
+from echam_ham_pascals import _get_cubes, _merge_cubes, _materialize_air_pressure
+from netcdf_header import get_netcdf_header
 from cis.data_io.products.gridded_NetCDF import DisplayConstraint
 
 
+def _get_last_level_index(filename, level_name):
+    """
+    Find the index of the last (i.e. surface) model level from the length of the level coordinate in a file's header
+
+    :return: The index, or None if the file doesn't have the level coordinate
+    """
+    sizes, attributes, variable_dimensions = get_netcdf_header(filename)
+    for var_name, var_attributes in attributes.items():
+        if var_attributes.get('long_name', None) == level_name and len(variable_dimensions[var_name]) == 1:
+            return sizes[variable_dimensions[var_name][0]] - 1
+    return None
+
+
+def _get_level_slice(cube, level_name, index):
+    """
+    Slice out a single model level (by its index along the level dimension) of a (lazy) cube, so that only that
+    hyperslab is read from the file when the data is realised
+
+    :return: The sliced cube, or None if the cube doesn't have the level
+    """
+    if index is None or not cube.coords(level_name):
+        return None
+    coord = cube.coord(level_name)
+    dims = cube.coord_dims(coord)
+    if not dims:
+        return cube
+    if index >= cube.shape[dims[0]]:
+        return None
+    return cube[tuple(index if d == dims[0] else slice(None) for d in range(cube.ndim))]
+
+
 class ECHAM_HAM_surface_only(ECHAM_HAM):
     """
-        Plugin for reading ECHAM-HAM NetCDF output files. 
+        Plugin for reading ECHAM-HAM NetCDF output files.
     """
 
+    # The model level coordinate, the last of which is the surface level
+    level_name = 'hybrid level at layer midpoints'
+
     def _create_cube(self, filenames, variable):
         """Creates a cube for the specified variable.
         :param filenames: List of filenames to read coordinates from
@@ -14,42 +50,44 @@ class ECHAM_HAM_surface_only(ECHAM_HAM):
         VariableConstraint object
         :return: If variable was specified this will return an UngriddedData object, otherwise a CoordList
         """
+        from iris.cube import CubeList
         from cis.exceptions import InvalidVariableError
-        from cis.data_io import gridded_data
-        import iris
 
-        # Check if the files given actually exist.
-        for filename in filenames:
-            with open(filename) as f:
-                pass
+        if variable is None:
+            raise InvalidVariableError("File contains more than one cube variable name must be specified")
 
         variable_constraint = variable
         if isinstance(variable, str):
             variable_constraint = DisplayConstraint(cube_func=(lambda c: c.var_name == variable or
                                                                 c.standard_name == variable or
-                                                                c.long_name == variable), display=variable,
-                                                    coord_values={'hybrid level at layer midpoints':
-                                                                      (lambda lev: lev == 31)})
+                                                                c.long_name == variable), display=variable)
         if len(filenames) == 1:
             callback_function = self.load_single_file_callback
         else:
             callback_function = self.load_multiple_files_callback
 
+        # Slice the surface level out of each file's (lazy) cube before merging them, rather than constraining the
+        #  merged 4-D cube, so only that level is ever read. This also raises an IOError if any files don't exist.
         try:
-            cube = gridded_data.load_cube(filenames, variable_constraint, callback=callback_function)
-        except iris.exceptions.ConstraintMismatchError as e:
-            if variable is None:
-                message = "File contains more than one cube variable name must be specified"
-            elif e.message == "no cubes found":
-                message = "Variable not found: {} \nTo see a list of variables run: cis info {}" \
-                    .format(str(variable), filenames[0])
-            else:
-                message = e.message
-            raise InvalidVariableError(message)
+            cubes = _get_cubes(filenames, variable_constraint, callback=callback_function)
+        except (IOError, OSError) as e:
+            raise IOError(str(e))
+        # The number of levels is read from the header of the first file
+        level_index = _get_last_level_index(filenames[0], self.level_name)
+        cubes = CubeList(c for c in (_get_level_slice(cube, self.level_name, level_index) for cube in cubes)
+                         if c is not None)
+        if not cubes:
+            raise InvalidVariableError("Variable not found: {} \nTo see a list of variables run: cis info {}"
+                                       .format(str(variable), filenames[0]))
+
+        try:
+            cube = _merge_cubes(cubes, variable_constraint)
         except ValueError as e:
             raise IOError(str(e))
 
+        # The aux coords are only added to the surface level cube
         self._add_available_aux_coords(cube, filenames)
+        if self.materialize_air_pressure:
+            _materialize_air_pressure(cube, filenames, self.air_pressure_dtype)
 
         return cube
-
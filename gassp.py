@@ -1,5 +1,7 @@
 from cis.data_io.products.NCAR_NetCDF_RAF import NCAR_NetCDF_RAF, NCAR_NetCDF_RAF_variable_name_selector
 
+from netcdf_campaign import CampaignProduct
+
 
 class GASSP_variable_name_selector(NCAR_NetCDF_RAF_variable_name_selector):
     # Static air pressure value for faam rack measurements
@@ -8,7 +10,49 @@ class GASSP_variable_name_selector(NCAR_NetCDF_RAF_variable_name_selector):
     PRESSURE_VAR_NAME = 'AIR_PRESSURE'
 
 
-class GASSP(NCAR_NetCDF_RAF):
+def _fix_air_pressure_units(data, m):
+    """
+    Parse the (often non-standard) air pressure units in GASSP files and convert the data to hPa
+    :param data: the air pressure data
+    :param m: the air pressure metadata
+    :return: the converted data and metadata
+    """
+    from cf_units import Unit
+    import logging
+
+    if not isinstance(m.units, Unit):
+        if ',' in m.units:
+            # Try splitting any commas out
+            m.units = m.units.split(',')[0]
+        if ' ' in m.units:
+            # Try splitting any spaces out
+            m.units = m.units.split()[0]
+    if str(m.units) == 'mb' or str(m.units) == 'Mb':
+        # Try converting to standard nomencleture
+        m.units = 'mbar'
+    if str(m.units) == 'hpa':
+        m.units = 'hPa'
+
+    logging.info("Parsed air pressure units {old}".format(old=m.units))
+    logging.info('Converting to hPa')
+    if not isinstance(m.units, str):
+        data = m.units.convert(data, 'hPa')
+        m.units = 'hPa'
+    return data, m
+
+
+def _fix_coordinate(standard_name, data, m):
+    """
+    Convert the (averaged) air pressure coordinate to hPa, as for the full rate data
+    """
+    if standard_name == 'air_pressure':
+        return _fix_air_pressure_units(data, m)
+    return data, m
+
+
+class GASSP(CampaignProduct, NCAR_NetCDF_RAF):
+
+    _fix_averaged_coordinate = staticmethod(_fix_coordinate)
 
     def __init__(self, variable_selector_class=GASSP_variable_name_selector):
         """
@@ -23,9 +67,18 @@ class GASSP(NCAR_NetCDF_RAF):
         Override the default read-in to also read in CCN quality flag data and apply the appropriate mask. We have
         to do this before creating the UngriddedData object so that the missing coords don't get fixed first
         """
-        from cis.data_io.netcdf import read_many_files_individually, get_metadata
-        from cis.utils import apply_mask_to_numpy_array, concatenate
+        from cis.data_io.netcdf import get_metadata
         from cis.data_io.ungridded_data import UngriddedCoordinates, UngriddedData
+        from netcdf_campaign import get_data_variables
+        from time_averaging import get_averaging_window, split_variable_statistic
+
+        window = get_averaging_window(self)
+        if window is not None:
+            # Stream the files into time window averages, excluding any flagged CCN data from them
+            file_variable = split_variable_statistic(variable)[0]
+            ccn_flag_var = "COL{}_FLAG".format(file_variable[-1]) if file_variable and \
+                file_variable.startswith('CCN_COL') else None
+            return self._create_averaged_coords(filenames, variable, window, ccn_flag_var)
 
         data_variables, variable_selector = self._load_data(filenames, variable)
 
@@ -43,15 +96,11 @@ class GASSP(NCAR_NetCDF_RAF):
 
             var_data = data_variables[variable]
             if variable and variable.startswith('CCN_COL'):
-                # Work out the associated variable name for this column
+                # Work out the associated variable name for this column and take it from the already open files
                 ccn_flag_var = "COL{}_FLAG".format(variable[-1])
-                # Read in the flags
-                flags = concatenate([get_data(v) for v in read_many_files_individually(filenames, ccn_flag_var)[
-                    ccn_flag_var]])
-                # 0 and 1 are both OK
-                mask = flags > 1
+                flag_variables = get_data_variables(variable_selector, filenames, [ccn_flag_var])[ccn_flag_var]
                 # If a variable was supplied then coords must be an ungridded data object, apply the mask to it
-                var_data = apply_mask_to_numpy_array(concatenate([get_data(v) for v in var_data]), mask)
+                var_data = _concatenate_flagged_data(var_data, flag_variables)
 
             return UngriddedData(var_data, get_metadata(data_variables[variable][0]), all_coords)
 
@@ -66,41 +115,55 @@ class GASSP(NCAR_NetCDF_RAF):
         """
         from cis.data_io.netcdf import get_metadata
         from cis.data_io.Coord import Coord
-        from cf_units import Unit
-        import logging
-
-        coordinate_data_objects = []
-        for d in data_variables[data_variable_name]:
-            data = get_data(d)
-            m = get_metadata(d)
-            m._name = m._name.lower()
-            m.standard_name = standard_name
-            if standard_name == 'air_pressure':
-                if not isinstance(m.units, Unit):
-                    if ',' in m.units:
-                        # Try splitting any commas out
-                        m.units = m.units.split(',')[0]
-                    if ' ' in m.units:
-                        # Try splitting any spaces out
-                        m.units = m.units.split()[0]
-                if str(m.units) == 'mb' or str(m.units) == 'Mb':
-                    # Try converting to standard nomencleture
-                    m.units = 'mbar'
-                if str(m.units) == 'hpa':
-                    m.units = 'hPa'
-
-                logging.info("Parsed air pressure units {old}".format(old=m.units))
-                logging.info('Converting to hPa')
-                if not isinstance(m.units, str):
-                    data = m.units.convert(data, 'hPa')
-                    m.units = 'hPa'
-
-            coordinate_data_objects.append(Coord(data, m, coord_axis))
-
-        return Coord.from_many_coordinates(coordinate_data_objects)
-
-
-def get_data(var):
+        from netcdf_campaign import concatenate_into
+
+        # Read each file straight into one native-order array, so any byte swapping is done as the data is copied in
+        variables = data_variables[data_variable_name]
+        data = concatenate_into((get_data(d, native=False) for d in variables), sum(d.shape[0] for d in variables))
+
+        m = get_metadata(variables[0])
+        m._name = m._name.lower()
+        m.standard_name = standard_name
+        m.shape = data.shape
+        if standard_name == 'air_pressure':
+            data, m = _fix_air_pressure_units(data, m)
+
+        return Coord(data, m, coord_axis)
+
+
+def _concatenate_flagged_data(data_variables, flag_variables, max_valid_flag=1):
+    """
+    Read the data from each file into a single preallocated masked array, masking (in place) any values whose quality
+    flag is greater than max_valid_flag
+
+    :param data_variables: A list of NetCDF Variables, one per file
+    :param flag_variables: The corresponding list of quality flag Variables
+    :param max_valid_flag: The largest flag value considered OK (0 and 1 are both OK for the CCN columns)
+    :return: A masked array of the data from all of the files
+    """
+    import numpy as np
+
+    # The data is swapped into native byte order as it's copied into the result
+    total_length = sum(v.shape[0] for v in data_variables)
+    result = None
+    start = 0
+    for data_var, flag_var in zip(data_variables, flag_variables):
+        data = get_data(data_var, native=False)
+        if result is None:
+            result = np.ma.masked_array(np.empty((total_length,) + data.shape[1:],
+                                                 dtype=data.dtype.newbyteorder('=')),
+                                        mask=np.zeros((total_length,) + data.shape[1:], dtype=bool))
+        elif np.promote_types(result.dtype, data.dtype) != result.dtype:
+            result = result.astype(np.promote_types(result.dtype, data.dtype))
+        end = start + data.shape[0]
+        result.data[start:end] = np.ma.getdata(data)
+        result.mask[start:end] = np.ma.getmaskarray(data)
+        result.mask[start:end] |= np.ma.filled(get_data(flag_var, native=False) > max_valid_flag, False)
+        start = end
+    return result
+
+
+def get_data(var, native=True):
     # FIXME: THIS IS COPIED FROM CIS 1.6, and is a nasty hack needed because of crap data
     from cis.data_io.netcdf import apply_offset_and_scaling, get_data
     import numpy as np
@@ -113,7 +176,9 @@ def get_data(var):
     # If the data isn't in the native endianess then flip it (in case it ends up in Pandas)
     # See https://docs.scipy.org/doc/numpy-1.10.1/user/basics.byteswapping.html#data-and-dtype-endianness-match-swap-data-and-dtype
     #  and https://stackoverflow.com/questions/30283836/creating-pandas-dataframe-from-numpy-array-leads-to-strange-errors
-    if data.dtype.byteorder != '=':
-        data = data.byteswap().newbyteorder()
+    # Callers which copy the data into a native buffer anyway (e.g. when concatenating) can skip this with
+    #  native=False, so that the bytes are only swapped once as they're copied.
+    if native and not data.dtype.isnative:
+        data = data.astype(data.dtype.newbyteorder('='))
 
     return data
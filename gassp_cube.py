@@ -1,4 +1,5 @@
 from ncar_raf_cube import NCAR_NetCDF_RAF_Cube, NCAR_NetCDF_RAF_variable_name_selector
+from gassp import _fix_air_pressure_units, _fix_coordinate
 
 
 class GASSP_variable_name_selector(NCAR_NetCDF_RAF_variable_name_selector):
@@ -10,6 +11,8 @@ class GASSP_variable_name_selector(NCAR_NetCDF_RAF_variable_name_selector):
 
 class GASSP_Cube(NCAR_NetCDF_RAF_Cube):
 
+    _fix_averaged_coordinate = staticmethod(_fix_coordinate)
+
     def __init__(self, variable_selector_class=GASSP_variable_name_selector):
         """
         Setup NCAR RAF data product, allow a different variable selector class if needed
@@ -29,34 +32,16 @@ class GASSP_Cube(NCAR_NetCDF_RAF_Cube):
         """
         from cis.data_io.netcdf import get_metadata
         from iris.coords import AuxCoord
-        from cis.utils import concatenate
-        from cf_units import Unit
-        import logging
+        from netcdf_campaign import concatenate_into
 
-        data = concatenate([get_data(d) for d in data_variables[data_variable_name]])
+        variables = data_variables[data_variable_name]
+        data = concatenate_into((get_data(d) for d in variables), sum(d.shape[0] for d in variables))
 
         m = get_metadata(data_variables[data_variable_name][0])
         m._name = m._name.lower()
         m.standard_name = standard_name
         if standard_name == 'air_pressure':
-            if not isinstance(m.units, Unit):
-                if ',' in m.units:
-                    # Try splitting any commas out
-                    m.units = m.units.split(',')[0]
-                if ' ' in m.units:
-                    # Try splitting any spaces out
-                    m.units = m.units.split()[0]
-            if str(m.units) == 'mb' or str(m.units) == 'Mb':
-                # Try converting to standard nomencleture
-                m.units = 'mbar'
-            if str(m.units) == 'hpa':
-                m.units = 'hPa'
-
-            logging.info("Parsed air pressure units {old}".format(old=m.units))
-            logging.info('Converting to hPa')
-            if not isinstance(m.units, str):
-                data = m.units.convert(data, 'hPa')
-                m.units = 'hPa'
+            data, m = _fix_air_pressure_units(data, m)
 
         return AuxCoord(data, units=m.units, standard_name=standard_name)
 
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import sqlite3
+
+# The name of the index file kept in each granule directory
+INDEX_FILENAME = '.cis_granule_index.sqlite'
+
+# Optional directory to keep the indices in instead (e.g. if the granule directories are read-only)
+INDEX_DIR = os.environ.get('CIS_GRANULE_INDEX_DIR', None)
+
+# Optional default region to restrict granules to, as 'lon_min,lon_max,lat_min,lat_max'
+REGION = os.environ.get('CIS_GRANULE_REGION', None)
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS granules (
+    filename TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    west REAL,
+    east REAL,
+    south REAL,
+    north REAL,
+    start_time TEXT,
+    end_time TEXT,
+    gring_lon TEXT,
+    gring_lat TEXT)"""
+
+# Granules crossing the dateline have west > east, in which case they cover [west, 180] and [-180, east]. Granules
+#  without a known extent are always included.
+_INTERSECTS = """west IS NULL OR ((south <= :lat_max AND north >= :lat_min) AND
+    ((west <= east AND west <= :lon_max AND east >= :lon_min) OR
+     (west > east AND (west <= :lon_max OR east >= :lon_min))))"""
+
+
+def get_index_filename(directory):
+    directory = os.path.abspath(directory)
+    if INDEX_DIR is None:
+        return os.path.join(directory, INDEX_FILENAME)
+    import hashlib
+    return os.path.join(INDEX_DIR, hashlib.md5(directory.encode()).hexdigest() + INDEX_FILENAME)
+
+
+def _connect(index_filename):
+    connection = sqlite3.connect(index_filename)
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def _read_granule_extent(filename):
+    """
+    Read the bounding rectangle, G-ring and time range of a granule from its ODL metadata
+    """
+    from hdf_eos_metadata import get_odl_metadata, get_bounding_rectangle, get_range_datetimes
+
+    metadata = get_odl_metadata(filename)
+    west, east, south, north = get_bounding_rectangle(filename)
+    try:
+        start, end = [d.isoformat() for d in get_range_datetimes(filename)]
+    except (KeyError, ValueError):
+        start, end = None, None
+    gring_lon = metadata.get('GRINGPOINTLONGITUDE', None)
+    gring_lat = metadata.get('GRINGPOINTLATITUDE', None)
+    return (west, east, south, north, start, end,
+            json.dumps(gring_lon) if gring_lon is not None else None,
+            json.dumps(gring_lat) if gring_lat is not None else None)
+
+
+def update_granule_index(filenames, index_filename):
+    """
+    Add any new (or modified) granules to an index, reading only their global ODL metadata
+
+    :param filenames: The granules to index
+    :param index_filename: The SQLite index file
+    :raises sqlite3.Error: If the index can't be created or written (e.g. in a read-only directory)
+    """
+    from pyhdf.error import HDF4Error
+
+    connection = _connect(index_filename)
+    try:
+        with connection:
+            indexed = {row[0]: (row[1], row[2])
+                       for row in connection.execute("SELECT filename, mtime, size FROM granules")}
+            for filename in filenames:
+                filename = os.path.abspath(filename)
+                stat = os.stat(filename)
+                if indexed.get(filename, None) == (stat.st_mtime, stat.st_size):
+                    continue
+                try:
+                    extent = _read_granule_extent(filename)
+                except (KeyError, ValueError, IOError, HDF4Error) as e:
+                    # E.g. a corrupt granule, which is indexed without an extent rather than aborting the whole index
+                    logging.warning("Unable to read the extent of granule {}, it won't be filtered: {}"
+                                    .format(filename, e))
+                    extent = (None,) * 8
+                connection.execute("INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (filename, stat.st_mtime, stat.st_size) + extent)
+    finally:
+        connection.close()
+
+
+def build_granule_index(directory, pattern='*.hdf'):
+    """
+    Create (or bring up to date) the index of all the granules in a directory
+
+    :param directory: The granule directory
+    :param pattern: A glob pattern for the granule files
+    :return: The index filename
+    """
+    import glob
+    index_filename = get_index_filename(directory)
+    update_granule_index(glob.glob(os.path.join(directory, pattern)), index_filename)
+    return index_filename
+
+
+def _split_box(lon_min, lon_max, lat_min, lat_max):
+    """
+    Split a lat/lon box which crosses the dateline (lon_min > lon_max) into the boxes either side of it
+    """
+    if lon_min > lon_max:
+        return [(lon_min, 180, lat_min, lat_max), (-180, lon_max, lat_min, lat_max)]
+    return [(lon_min, lon_max, lat_min, lat_max)]
+
+
+def _closed_path(vertices):
+    from matplotlib.path import Path
+
+    # The last vertex of a closed path is ignored, so repeat the first one there
+    return Path(list(vertices) + [vertices[0]], closed=True)
+
+
+def _gring_intersects(gring_lon, gring_lat, lon_min, lon_max, lat_min, lat_max):
+    """
+    Check if a G-ring polygon intersects a lat/lon box (which doesn't cross the dateline). This is conservative:
+    polygons which cross the dateline are always assumed to intersect.
+    """
+    lons, lats = json.loads(gring_lon), json.loads(gring_lat)
+    if max(lons) - min(lons) > 180:
+        return True
+    polygon = _closed_path(list(zip(lons, lats)))
+    box = _closed_path([(lon_min, lat_min), (lon_max, lat_min), (lon_max, lat_max), (lon_min, lat_max)])
+    return polygon.intersects_path(box, filled=True)
+
+
+def query_granule_index(index_filename, lon_min, lon_max, lat_min, lat_max):
+    """
+    Find the granules in an index which could intersect a lat/lon box
+
+    :param index_filename: The SQLite index file
+    :param lon_min: The western edge of the box, in the range -180 to 180
+    :param lon_max: The eastern edge of the box, in the range -180 to 180. If this is less than lon_min the box crosses
+     the dateline.
+    :param lat_min: The southern edge of the box
+    :param lat_max: The northern edge of the box
+    :return: A set of the (absolute) filenames of the intersecting granules
+    """
+    intersecting = set()
+    connection = _connect(index_filename)
+    try:
+        for box in _split_box(lon_min, lon_max, lat_min, lat_max):
+            rows = connection.execute("SELECT filename, gring_lon, gring_lat FROM granules WHERE " + _INTERSECTS,
+                                      dict(zip(('lon_min', 'lon_max', 'lat_min', 'lat_max'), box))).fetchall()
+            intersecting.update(filename for filename, gring_lon, gring_lat in rows
+                                if gring_lon is None or gring_lat is None or
+                                _gring_intersects(gring_lon, gring_lat, *box))
+    finally:
+        connection.close()
+    return intersecting
+
+
+def filter_granules(filenames, region=None):
+    """
+    Remove the granules which can't intersect a region, using (and updating) the index of each granule's directory.
+    No SD data is read from any of the files.
+
+    :param filenames: The granule filenames
+    :param region: A (lon_min, lon_max, lat_min, lat_max) tuple, or a comma separated string of the same. Defaults to
+     CIS_GRANULE_REGION, all of the files are returned if neither is set
+    :return: The filenames, in their original order, which could intersect the region
+    """
+    from collections import OrderedDict
+
+    region = REGION if region is None else region
+    if region is None:
+        return filenames
+    if isinstance(region, str):
+        region = [float(r) for r in region.split(',')]
+    lon_min, lon_max, lat_min, lat_max = region
+
+    by_directory = OrderedDict()
+    for filename in filenames:
+        by_directory.setdefault(os.path.dirname(os.path.abspath(filename)), []).append(filename)
+
+    intersecting = set()
+    for directory, directory_files in by_directory.items():
+        index_filename = get_index_filename(directory)
+        try:
+            update_granule_index(directory_files, index_filename)
+            intersecting |= query_granule_index(index_filename, lon_min, lon_max, lat_min, lat_max)
+        except sqlite3.Error as e:
+            # E.g. the directory is read-only, in which case CIS_GRANULE_INDEX_DIR can be set to index it elsewhere
+            logging.warning("Unable to use the granule index {}, reading all of the granules in {}: {}"
+                            .format(index_filename, directory, e))
+            intersecting.update(os.path.abspath(f) for f in directory_files)
+
+    filtered = [f for f in filenames if os.path.abspath(f) in intersecting]
+    logging.info("{} of {} granules intersect the region {}".format(len(filtered), len(filenames), tuple(region)))
+    if not filtered:
+        raise ValueError("None of the granules intersect the region {}".format(tuple(region)))
+    return filtered
@@ -0,0 +1,123 @@
+import datetime as dt
+import os
+import re
+
+# Parsed ODL metadata, keyed by (path, mtime, size) of the file it was read from
+_ODL_METADATA = {}
+
+# The global attributes of HDF-EOS files which hold ODL metadata, these may be split over several numbered attributes
+#  (e.g. CoreMetadata.0, CoreMetadata.1)
+ODL_ATTRIBUTES = ['CoreMetadata', 'ArchiveMetadata']
+
+
+def _parse_odl_value(value):
+    """
+    Convert an ODL value into a Python value: quoted strings become str, parenthesised lists become lists and numbers
+    become int or float. Anything else is returned as the raw (stripped) string.
+    """
+    value = value.strip()
+    if value.startswith('(') and value.endswith(')'):
+        return [_parse_odl_value(v) for v in re.findall(r'"[^"]*"|[^,]+', value[1:-1]) if v.strip()]
+    if value.startswith('"'):
+        return value.strip('"')
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_odl(text):
+    """
+    Parse the OBJECT values from an ODL (Object Description Language) metadata string, as found in the CoreMetadata
+    and ArchiveMetadata attributes of HDF-EOS files, in a single pass.
+
+    :param text: The ODL string
+    :return: A dictionary of the VALUE of each OBJECT, keyed by the object name. If an object name is repeated the
+     first value is kept.
+    """
+    values = {}
+    objects = []
+    pending = None
+    for line in text.splitlines():
+        if pending is not None:
+            # Continue a value which spans multiple lines
+            pending += ' ' + line.strip()
+            if pending.count('(') > pending.count(')') or pending.count('"') % 2:
+                continue
+            line, pending = pending, None
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        key, value = key.strip(), value.strip()
+        if key == 'OBJECT':
+            objects.append(value)
+        elif key == 'END_OBJECT':
+            if objects:
+                objects.pop()
+        elif key == 'VALUE' and objects:
+            if value.count('(') > value.count(')') or value.count('"') % 2:
+                pending = line
+                continue
+            values.setdefault(objects[-1], _parse_odl_value(value))
+    return values
+
+
+def get_odl_metadata(filename):
+    """
+    Read and parse the ODL metadata (CoreMetadata and ArchiveMetadata) of an HDF-EOS file. The result is memoized per
+    file, so the file attributes are only read and parsed once however many times the metadata is needed.
+
+    :param filename: The HDF4 file to read
+    :return: A dictionary of ODL object values, see parse_odl
+    """
+    from cis.data_io import hdf
+
+    stat = os.stat(filename)
+    key = os.path.abspath(filename), stat.st_mtime, stat.st_size
+    if key not in _ODL_METADATA:
+        attributes = hdf.get_hdf4_file_metadata(filename)
+        metadata = {}
+        for odl_attribute in ODL_ATTRIBUTES:
+            # Join any parts of the attribute together in order before parsing
+            parts = sorted((name for name in attributes if name.split('.')[0].lower() == odl_attribute.lower()),
+                           key=lambda name: int(name.split('.')[-1]) if name.split('.')[-1].isdigit() else 0)
+            for name, value in parse_odl(''.join(attributes[name] for name in parts)).items():
+                metadata.setdefault(name, value)
+        _ODL_METADATA[key] = metadata
+    return _ODL_METADATA[key]
+
+
+def _parse_range_datetime(metadata, date_key, time_key):
+    date, time = metadata[date_key], metadata[time_key]
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return dt.datetime.strptime(date + " " + time, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Unable to parse date time: {} {}".format(date, time))
+
+
+def get_range_datetimes(filename):
+    """
+    Get the start and end of the data in an HDF-EOS file from its RANGEBEGINNING/RANGEENDING metadata
+
+    :param filename: The HDF4 file to read
+    :return: A tuple of (start, end) datetimes
+    """
+    metadata = get_odl_metadata(filename)
+    return (_parse_range_datetime(metadata, 'RANGEBEGINNINGDATE', 'RANGEBEGINNINGTIME'),
+            _parse_range_datetime(metadata, 'RANGEENDINGDATE', 'RANGEENDINGTIME'))
+
+
+def get_bounding_rectangle(filename):
+    """
+    Get the bounding rectangle of the data in an HDF-EOS file from its metadata
+
+    :param filename: The HDF4 file to read
+    :return: A tuple of (west, east, south, north) bounding coordinates, in degrees
+    """
+    metadata = get_odl_metadata(filename)
+    return tuple(float(metadata[name]) for name in ['WESTBOUNDINGCOORDINATE', 'EASTBOUNDINGCOORDINATE',
+                                                     'SOUTHBOUNDINGCOORDINATE', 'NORTHBOUNDINGCOORDINATE'])
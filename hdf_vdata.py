@@ -0,0 +1,76 @@
+from itertools import chain
+
+import numpy as np
+
+# Number of records to pull from the Vdata interface at a time. pyhdf returns each batch as nested Python lists, so
+#  this bounds the number of intermediate Python objects alive at once.
+DEFAULT_BATCH_SIZE = 65536
+
+
+def _get_field_dtypes():
+    from pyhdf.HC import HC
+    return {HC.UCHAR8: np.uint8,
+            HC.INT8: np.int8,
+            HC.UINT8: np.uint8,
+            HC.INT16: np.int16,
+            HC.UINT16: np.uint16,
+            HC.INT32: np.int32,
+            HC.UINT32: np.uint32,
+            HC.FLOAT32: np.float32,
+            HC.FLOAT64: np.float64}
+
+
+def _flatten_records(records):
+    """
+    Flatten the nested lists returned by VD.read into a stream of values. Each record is a list of fields, and each
+    field is either a scalar or, for fields with an order greater than one, a list of values.
+    """
+    for record in records:
+        for field in record:
+            if isinstance(field, list):
+                yield from field
+            else:
+                yield field
+
+
+def read_vdata(vd, nrec=None, fields=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Read the records of an attached Vdata into a flat, preallocated NumPy array of the fields' own data type. This is
+    equivalent to np.array(vd.read(nRec=nrec)).flatten() but never materialises the whole Vdata as Python objects.
+
+    :param vd: An attached pyhdf VD instance
+    :param nrec: The number of records to read, defaults to all of them
+    :param fields: An optional list of field names to read (passed to VD.setfields), defaults to all fields
+    :param batch_size: The number of records to read from the file at a time
+    :return: A one-dimensional numpy array containing the values of every field for every record
+    """
+    field_dtypes = _get_field_dtypes()
+
+    field_info = vd.fieldinfo()
+    if fields is not None:
+        vd.setfields(*fields)
+        field_info = [f for f in field_info if f[0] in fields]
+
+    if nrec is None:
+        nrec = vd.inquire()[0]
+
+    try:
+        dtype = np.result_type(*[field_dtypes[f[1]] for f in field_info])
+    except KeyError:
+        # Character fields can't be put in a numeric buffer so fall back to the list round-trip
+        return np.array(vd.read(nRec=nrec)).flatten()
+
+    # Number of values in each record
+    width = sum(f[2] for f in field_info)
+    single_scalar_field = len(field_info) == 1 and width == 1
+
+    data = np.empty(nrec * width, dtype=dtype)
+    start = 0
+    while start < nrec:
+        n = min(batch_size, nrec - start)
+        records = vd.read(nRec=n)
+        values = chain.from_iterable(records) if single_scalar_field else _flatten_records(records)
+        data[start * width:(start + n) * width] = np.fromiter(values, dtype=dtype, count=n * width)
+        start += n
+
+    return data
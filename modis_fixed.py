@@ -6,20 +6,39 @@ from cis.data_io.ungridded_data import UngriddedData
 import numpy as np
 
 
+def _get_tie_point_grids(lines5km):
+    # FIXME: I changed the values here to work with MOD06 - but why?!
+    cols5km = np.arange(2, 1350, 5) / 5.0
+    cols1km = np.arange(1350) / 5.0
+    lines = lines5km * 5
+    rows5km = np.arange(2, lines, 5) / 5.0
+    rows1km = np.arange(lines) / 5.0
+    return rows5km, cols5km, rows1km, cols1km
+
+
 def modis5kmto1km(lons5km, lats5km):
     """Getting 1km geolocation for modis from 5km tiepoints.
 
+    This uses the vectorized, float32, interpolator in modis_geolocation and produces the same (linear along-track,
+    cubic across-track) interpolation as modis5kmto1km_geotiepoints.
+
+    http://www.icare.univ-lille1.fr/tutorials/MODIS_geolocation
+    """
+    from modis_geolocation import interpolate_tie_points
+
+    rows5km, cols5km, rows1km, cols1km = _get_tie_point_grids(lons5km.shape[0])
+    return interpolate_tie_points(lons5km, lats5km, rows5km, cols5km, rows1km, cols1km)
+
+
+def modis5kmto1km_geotiepoints(lons5km, lats5km):
+    """Getting 1km geolocation for modis from 5km tiepoints using the (slower) geotiepoints interpolator.
+
     http://www.icare.univ-lille1.fr/tutorials/MODIS_geolocation
     """
     from geotiepoints.geointerpolator import \
         GeoInterpolator as SatelliteInterpolator
 
-    # FIXME: I changed the values here to work with MOD06 - but why?!
-    cols5km = np.arange(2, 1350, 5) / 5.0
-    cols1km = np.arange(1350) / 5.0
-    lines = lons5km.shape[0] * 5
-    rows5km = np.arange(2, lines, 5) / 5.0
-    rows1km = np.arange(lines) / 5.0
+    rows5km, cols5km, rows1km, cols1km = _get_tie_point_grids(lons5km.shape[0])
 
     along_track_order = 1
     cross_track_order = 3
@@ -39,6 +58,10 @@ class MOD06_HACK(MODIS_L2):
 
     priority = 1
 
+    # An optional (lon_min, lon_max, lat_min, lat_max) region, granules which can't intersect it are skipped. See
+    #  granule_index.filter_granules
+    region = None
+
     def __get_data_scale(self, filename, variable):
         from cis.exceptions import InvalidVariableError
         from pyhdf.SD import SD
@@ -55,6 +78,10 @@ class MOD06_HACK(MODIS_L2):
 
     def _create_coord_list(self, filenames, variable=None):
         import datetime as dt
+        from cis.utils import concatenate
+        from cis.time_util import convert_sec_since_to_std_time, cis_standard_time_unit
+        from modis_geolocation import get_1km_geolocation, get_cached_granule_value, BlockRepeated, \
+            expand_block_repeated
 
         variables = ['Latitude', 'Longitude', 'Scan_Start_Time']
         logging.info("Listing coordinates: " + str(variables))
@@ -67,12 +94,21 @@ class MOD06_HACK(MODIS_L2):
             self.apply_interpolation = scale == "1km"
 
         lat = sdata['Latitude']
-        lat_data = hdf.read_data(lat, _get_MODIS_SDS_data)
         lon = sdata['Longitude']
-        lon_data = hdf.read_data(lon, _get_MODIS_SDS_data)
 
         if self.apply_interpolation:
-            lon_data, lat_data = modis5kmto1km(lon_data[:], lat_data[:])
+            # Interpolate (or fetch the cached interpolation of) each granule separately
+            lon_arrays, lat_arrays = [], []
+            for filename, lon_sds, lat_sds in zip(filenames, lon, lat):
+                lon_data, lat_data = get_1km_geolocation(filename, lambda: (_get_MODIS_SDS_data(lon_sds)[:],
+                                                                            _get_MODIS_SDS_data(lat_sds)[:]),
+                                                         modis5kmto1km)
+                lon_arrays.append(lon_data)
+                lat_arrays.append(lat_data)
+            lon_data, lat_data = concatenate(lon_arrays), concatenate(lat_arrays)
+        else:
+            lat_data = hdf.read_data(lat, _get_MODIS_SDS_data)
+            lon_data = hdf.read_data(lon, _get_MODIS_SDS_data)
 
         lat_metadata = hdf.read_metadata(lat, "SD")
         lat_coord = Coord(lat_data, lat_metadata, 'Y')
@@ -84,17 +120,33 @@ class MOD06_HACK(MODIS_L2):
         time_metadata = hdf.read_metadata(time, "SD")
         # Ensure the standard name is set
         time_metadata.standard_name = 'time'
-        time_data = hdf.read_data(time, _get_MODIS_SDS_data)
-        if self.apply_interpolation: 
-            time_data = np.repeat(np.repeat(time_data, 5, axis=0), 5, axis=1)
-        time_coord = Coord(time_data, time_metadata, "T")
-        time_coord.convert_TAI_time_to_std_time(dt.datetime(1993, 1, 1, 0, 0, 0))
+        if self.apply_interpolation:
+            # Convert the 5km times first and only expand them onto the 1km grid when the coordinate data is needed
+            time_managers = [BlockRepeated(get_cached_granule_value(
+                filename, 'time5km_std', lambda: convert_sec_since_to_std_time(_get_MODIS_SDS_data(t),
+                                                                                dt.datetime(1993, 1, 1, 0, 0, 0))),
+                (5, 5)) for filename, t in zip(filenames, time)]
+            time_metadata.units = cis_standard_time_unit
+            time_metadata.shape = (sum(m.shape[0] for m in time_managers), time_managers[0].shape[1])
+            time_coord = Coord(time_managers, time_metadata, "T", data_retrieval_callback=expand_block_repeated)
+        else:
+            time_data = hdf.read_data(time, _get_MODIS_SDS_data)
+            time_coord = Coord(time_data, time_metadata, "T")
+            time_coord.convert_TAI_time_to_std_time(dt.datetime(1993, 1, 1, 0, 0, 0))
 
         return CoordList([lat_coord, lon_coord, time_coord])
 
+    def create_coords(self, filenames, variable=None):
+        from granule_index import filter_granules
+        return super(MOD06_HACK, self).create_coords(filter_granules(filenames, self.region), variable)
+
     def create_data_object(self, filenames, variable):
+        from granule_index import filter_granules
         logging.debug("Creating data object for variable " + variable)
 
+        # Drop any granules outside of the region of interest before reading anything
+        filenames = filter_granules(filenames, self.region)
+
         # reading coordinates
         # the variable here is needed to work out whether to apply interpolation to the lat/lon data or not
         coords = self._create_coord_list(filenames, variable)
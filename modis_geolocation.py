@@ -0,0 +1,257 @@
+from collections import OrderedDict
+import logging
+import os
+
+import numpy as np
+
+# Maximum number of granules to keep interpolated geolocation for in memory
+GEOLOCATION_CACHE_SIZE = 8
+
+# Optional directory for float32 sidecar files of the interpolated geolocation, to be reused across runs
+GEOLOCATION_SIDECAR_DIR = os.environ.get('CIS_MODIS_GEOLOCATION_CACHE_DIR', None)
+
+_GEOLOCATION_CACHE = OrderedDict()
+
+
+def _granule_key(filename):
+    """
+    Key a granule on its path, modification time and size so that rewritten files aren't served from the cache
+    """
+    stat = os.stat(filename)
+    return os.path.abspath(filename), stat.st_mtime, stat.st_size
+
+
+def _make_read_only(value):
+    """
+    Mark an array (or the arrays in a tuple) as read-only, so that a cached value can't be changed by its users
+    """
+    if isinstance(value, tuple):
+        for v in value:
+            _make_read_only(v)
+    elif isinstance(value, np.ndarray):
+        value.setflags(write=False)
+        mask = np.ma.getmask(value)
+        if mask is not np.ma.nomask:
+            mask.setflags(write=False)
+    return value
+
+
+def get_cached_granule_value(filename, name, fn, cache_size=None):
+    """
+    Return the value of fn() for a granule, caching it in memory with least-recently-used eviction. Any arrays in the
+    value are made read-only as the same arrays are returned to every caller, so copy them before modifying them.
+
+    :param filename: The granule the value belongs to
+    :param name: A name for the value, unique within the granule
+    :param fn: Function which computes the value on a miss
+    :param cache_size: The maximum number of values to keep, defaults to GEOLOCATION_CACHE_SIZE
+    :return: The cached or computed value
+    """
+    cache_size = GEOLOCATION_CACHE_SIZE if cache_size is None else cache_size
+    key = _granule_key(filename) + (name,)
+    try:
+        _GEOLOCATION_CACHE.move_to_end(key)
+        return _GEOLOCATION_CACHE[key]
+    except KeyError:
+        pass
+
+    value = _make_read_only(fn())
+    _GEOLOCATION_CACHE[key] = value
+    while len(_GEOLOCATION_CACHE) > cache_size:
+        _GEOLOCATION_CACHE.popitem(last=False)
+    return value
+
+
+def clear_geolocation_cache():
+    _GEOLOCATION_CACHE.clear()
+
+
+def _sidecar_filename(filename, name, sidecar_dir):
+    return os.path.join(sidecar_dir, "{}.{}.npz".format(os.path.basename(filename), name))
+
+
+def _read_sidecar(filename, name, sidecar_dir):
+    sidecar = _sidecar_filename(filename, name, sidecar_dir)
+    if not os.path.isfile(sidecar):
+        return None
+    _, mtime, size = _granule_key(filename)
+    with np.load(sidecar) as f:
+        if f['source_mtime'] != mtime or f['source_size'] != size:
+            logging.info("Ignoring out of date geolocation sidecar {}".format(sidecar))
+            return None
+        return f['lons'], f['lats']
+
+
+def _write_sidecar(filename, name, sidecar_dir, lons, lats):
+    _, mtime, size = _granule_key(filename)
+    sidecar = _sidecar_filename(filename, name, sidecar_dir)
+    try:
+        os.makedirs(sidecar_dir, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see a partial sidecar
+        tmp_file = sidecar + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(tmp_file, lons=lons, lats=lats, source_mtime=mtime, source_size=size)
+        os.replace(tmp_file, sidecar)
+    except (IOError, OSError) as e:
+        logging.warning("Unable to write geolocation sidecar {}: {}".format(sidecar, e))
+
+
+def get_1km_geolocation(filename, read_5km, interpolator, sidecar_dir=None):
+    """
+    Get the 1km longitudes and latitudes for a MODIS granule, interpolating them from the 5km tie-points only if they
+    aren't already cached in memory or (optionally) in a sidecar file. The arrays are always float32 and read-only.
+
+    :param filename: The granule filename
+    :param read_5km: Function returning the (lons5km, lats5km) arrays for the granule, only called on a cache miss
+    :param interpolator: Function taking (lons5km, lats5km) and returning (lons1km, lats1km)
+    :param sidecar_dir: Directory for sidecar files, defaults to GEOLOCATION_SIDECAR_DIR. No sidecars are used if None
+    :return: A tuple of the float32 (lons1km, lats1km)
+    """
+    sidecar_dir = GEOLOCATION_SIDECAR_DIR if sidecar_dir is None else sidecar_dir
+    name = "geo1km_{}_{}".format(interpolator.__module__, interpolator.__name__)
+
+    def _interpolate():
+        if sidecar_dir is not None:
+            geolocation = _read_sidecar(filename, name, sidecar_dir)
+            if geolocation is not None:
+                return geolocation
+
+        logging.debug("Interpolating 1km geolocation for {}".format(filename))
+        lons1km, lats1km = [np.asarray(a, dtype=np.float32) for a in interpolator(*read_5km())]
+
+        if sidecar_dir is not None:
+            _write_sidecar(filename, name, sidecar_dir, lons1km, lats1km)
+        return lons1km, lats1km
+
+    return get_cached_granule_value(filename, name, _interpolate)
+
+
+def _linear_weights(tie_points, points):
+    """
+    Indices and weights for linear interpolation (with linear extrapolation beyond the end tie-points)
+    """
+    idx = np.clip(np.searchsorted(tie_points, points, side='right') - 1, 0, len(tie_points) - 2)
+    weights = (points - tie_points[idx]) / (tie_points[idx + 1] - tie_points[idx])
+    return idx, weights.astype(np.float32)
+
+
+def _cubic_spline_matrix(tie_points, points):
+    """
+    The matrix W such that W.dot(y) evaluates the not-a-knot interpolating cubic spline through (tie_points, y) at
+    points. This is the same spline as a RectBivariateSpline with s=0, and points outside the tie-points are
+    extrapolated using the end polynomials.
+    """
+    n = len(tie_points)
+    h = np.diff(tie_points)
+
+    # Solve A.M = B.y for the second derivatives, M, of the spline
+    a = np.zeros((n, n))
+    b = np.zeros((n, n))
+    for i in range(1, n - 1):
+        a[i, i - 1:i + 2] = h[i - 1], 2 * (h[i - 1] + h[i]), h[i]
+        b[i, i - 1:i + 2] = 6 / h[i - 1], -6 / h[i - 1] - 6 / h[i], 6 / h[i]
+    # Not-a-knot end conditions - the third derivative is continuous across the second and penultimate tie-points
+    a[0, :3] = 1 / h[0], -1 / h[0] - 1 / h[1], 1 / h[1]
+    a[-1, -3:] = 1 / h[-2], -1 / h[-2] - 1 / h[-1], 1 / h[-1]
+    second_derivatives = np.linalg.solve(a, b)
+
+    idx = np.clip(np.searchsorted(tie_points, points, side='right') - 1, 0, n - 2)
+    hi = h[idx]
+    left = tie_points[idx + 1] - points
+    right = points - tie_points[idx]
+
+    rows = np.arange(len(points))
+    w = (left ** 3 / (6 * hi) - left * hi / 6)[:, np.newaxis] * second_derivatives[idx] + \
+        (right ** 3 / (6 * hi) - right * hi / 6)[:, np.newaxis] * second_derivatives[idx + 1]
+    w[rows, idx] += left / hi
+    w[rows, idx + 1] += right / hi
+    # The influence of distant tie-points decays exponentially, drop it before it underflows into float32 subnormals
+    #  (which are very slow to multiply)
+    w[np.abs(w) < 1e-10] = 0
+    return w.astype(np.float32)
+
+
+def interpolate_tie_points(lons, lats, tie_rows, tie_cols, rows, cols, block_size=200, max_workers=None):
+    """
+    Interpolate longitudes and latitudes given on a grid of tie-points onto a finer grid, linearly along-track (rows)
+    and with a cubic spline across-track (columns). The interpolation is done on Cartesian coordinates on the unit
+    sphere, so it is well behaved across the dateline and near the poles, and in float32. Blocks of output rows are
+    processed concurrently in a thread pool (NumPy releases the GIL for the heavy lifting).
+
+    :param lons: 2D array of tie-point longitudes (rows, cols)
+    :param lats: 2D array of tie-point latitudes (rows, cols)
+    :param tie_rows: The row positions of the tie-points on the output grid
+    :param tie_cols: The column positions of the tie-points on the output grid
+    :param rows: The output row positions
+    :param cols: The output column positions
+    :param block_size: The number of output rows to interpolate in each block
+    :param max_workers: The number of threads to use, defaults to the ThreadPoolExecutor default
+    :return: A tuple of the float32 (lons, lats) on the output grid
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    lons = np.deg2rad(np.ma.getdata(lons).astype(np.float32))
+    lats = np.deg2rad(np.ma.getdata(lats).astype(np.float32))
+    cos_lats = np.cos(lats)
+    xyz = np.stack([cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)])
+
+    tie_rows, tie_cols = np.asarray(tie_rows, dtype=np.float64), np.asarray(tie_cols, dtype=np.float64)
+    rows, cols = np.asarray(rows, dtype=np.float64), np.asarray(cols, dtype=np.float64)
+    row_idx, row_weights = _linear_weights(tie_rows, rows)
+    col_matrix = _cubic_spline_matrix(tie_cols, cols).T
+
+    out_lons = np.empty((len(rows), len(cols)), dtype=np.float32)
+    out_lats = np.empty((len(rows), len(cols)), dtype=np.float32)
+
+    def _interpolate_block(start):
+        block = slice(start, start + block_size)
+        idx, weights = row_idx[block], row_weights[block][:, np.newaxis]
+        # Along-track first, then across-track as a single matrix product for each Cartesian component
+        x, y, z = [(c[idx] * (1 - weights) + c[idx + 1] * weights).dot(col_matrix) for c in xyz]
+        out_lons[block] = np.rad2deg(np.arctan2(y, x))
+        out_lats[block] = np.rad2deg(np.arctan2(z, np.hypot(x, y)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Consume the results so that any exceptions are raised here
+        list(executor.map(_interpolate_block, range(0, len(rows), block_size)))
+
+    return out_lons, out_lats
+
+
+class BlockRepeated(object):
+    """
+    A lazily expanded array, in which each element of a (coarse) base array is repeated over a block of the output.
+    This can be used as a data manager for a CIS Coord (with expand_block_repeated as the data retrieval callback) so
+    that, e.g., a 5km time field is only expanded onto the 1km grid when the coordinate data is actually needed.
+    """
+
+    def __init__(self, data, block_shape):
+        """
+        :param data: The 2D base array
+        :param block_shape: The (rows, cols) size of the block each base element is repeated over
+        """
+        self.data = data
+        self.block_shape = tuple(block_shape)
+
+    @property
+    def shape(self):
+        return tuple(n * b for n, b in zip(self.data.shape, self.block_shape))
+
+    def expand(self):
+        """
+        Materialise the full resolution array, with a single copy
+        """
+        rows, cols = self.data.shape
+        block_rows, block_cols = self.block_shape
+
+        def _expand(a):
+            return np.broadcast_to(a[:, np.newaxis, :, np.newaxis],
+                                   (rows, block_rows, cols, block_cols)).reshape(self.shape)
+
+        mask = np.ma.getmask(self.data)
+        if mask is np.ma.nomask:
+            return _expand(np.ma.getdata(self.data))
+        return np.ma.masked_array(_expand(np.ma.getdata(self.data)), mask=_expand(mask))
+
+
+def expand_block_repeated(block_repeated):
+    return block_repeated.expand()
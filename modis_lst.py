@@ -6,6 +6,10 @@ from cis.data_io.Coord import Coord, CoordList
 
 class MODIS_LST(MODIS_L2):
 
+    # An optional (lon_min, lon_max, lat_min, lat_max) region, granules which can't intersect it are skipped. See
+    #  granule_index.filter_granules
+    region = None
+
     def get_file_signature(self):
         product_names = ['MYD11_L2']
         regex_list = [r'.*' + product + '.*\.hdf' for product in product_names]
@@ -26,28 +30,9 @@ class MODIS_LST(MODIS_L2):
                 return scaling
         return None
 
-    def _parse_datetime(self, metadata_dict, keyword):
-        import re
-        res = ""
-        for s in metadata_dict.values():
-            i_start = s.find(keyword)
-            ssub = s[i_start:len(s)]
-            i_end = ssub.find("END_OBJECT")
-            ssubsub = s[i_start:i_start + i_end]
-            matches = re.findall('".*"', ssubsub)
-            if len(matches) > 0:
-                res = matches[0].replace('\"', '')
-                if res is not "":
-                    break
-        return res
-
     def _get_start_date(self, filename):
-        import datetime as dt
-        metadata_dict = hdf.get_hdf4_file_metadata(filename)
-        date = self._parse_datetime(metadata_dict, 'RANGEBEGINNINGDATE')
-        time = self._parse_datetime(metadata_dict, 'RANGEBEGINNINGTIME')
-        datetime_str = date + " " + time
-        return dt.datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S.%f")
+        from hdf_eos_metadata import get_range_datetimes
+        return get_range_datetimes(filename)[0]
 
     def _create_coord_list(self, filenames, variable=None):
         import datetime as dt
@@ -55,6 +40,7 @@ class MODIS_LST(MODIS_L2):
         from cis.utils import concatenate
         from cf_units import Unit
         from geotiepoints import modis5kmto1km
+        from modis_geolocation import get_1km_geolocation
 
         variables = ['Latitude', 'Longitude', 'View_time']
         logging.info("Listing coordinates: " + str(variables))
@@ -64,16 +50,24 @@ class MODIS_LST(MODIS_L2):
         apply_interpolation = False
         if variable is not None:
             scale = self.__get_data_scale(filenames[0], variable)
-            apply_interpolation = True if scale is "1km" else False
+            apply_interpolation = scale == "1km"
 
-        lat_data = hdf.read_data(sdata['Latitude'], _get_MODIS_SDS_data)
         lat_metadata = hdf.read_metadata(sdata['Latitude'], "SD")
-
-        lon_data = hdf.read_data(sdata['Longitude'], _get_MODIS_SDS_data)
         lon_metadata = hdf.read_metadata(sdata['Longitude'], "SD")
 
         if apply_interpolation:
-            lon_data, lat_data = modis5kmto1km(lon_data, lat_data)
+            # Interpolate (or fetch the cached interpolation of) each granule separately
+            lon_arrays, lat_arrays = [], []
+            for f, lon_sds, lat_sds in zip(filenames, sdata['Longitude'], sdata['Latitude']):
+                lon_data, lat_data = get_1km_geolocation(f, lambda: (_get_MODIS_SDS_data(lon_sds),
+                                                                     _get_MODIS_SDS_data(lat_sds)),
+                                                         modis5kmto1km)
+                lon_arrays.append(lon_data)
+                lat_arrays.append(lat_data)
+            lon_data, lat_data = concatenate(lon_arrays), concatenate(lat_arrays)
+        else:
+            lat_data = hdf.read_data(sdata['Latitude'], _get_MODIS_SDS_data)
+            lon_data = hdf.read_data(sdata['Longitude'], _get_MODIS_SDS_data)
 
         lat_coord = Coord(lat_data, lat_metadata, 'Y')
         lon_coord = Coord(lon_data, lon_metadata, 'X')
@@ -94,3 +88,12 @@ class MODIS_LST(MODIS_L2):
         time_coord = Coord(concatenate(t_arrays), time_metadata, "T")
 
         return CoordList([lat_coord, lon_coord, time_coord])
+
+    def create_coords(self, filenames, variable=None):
+        from granule_index import filter_granules
+        return super(MODIS_LST, self).create_coords(filter_granules(filenames, self.region), variable)
+
+    def create_data_object(self, filenames, variable):
+        from granule_index import filter_granules
+        # Drop any granules outside of the region of interest before reading anything
+        return super(MODIS_LST, self).create_data_object(filter_granules(filenames, self.region), variable)
@@ -1,13 +1,17 @@
 from cis.data_io.products import NetCDF_Gridded
 import cis.data_io.gridded_data as gd
+from cube_cache import CUBE_CACHE
 
-gd.CACHED_CUBES = {}
+gd.CACHED_CUBES = CUBE_CACHE
 
 class multi_netcdf(NetCDF_Gridded):
     """
         Plugin for reading ECHAM-HAM NetCDF output files. 
     """
     priority=100
+    # Directory of an on-disk cache of the created data objects shared between processes, defaults to
+    #  CIS_CUBE_DISK_CACHE_DIR (if that isn't set either the cache isn't used)
+    cube_cache_dir = None
 
     @staticmethod
     def load_multiple_files_callback(cube, field, filename):
@@ -18,6 +22,10 @@ class multi_netcdf(NetCDF_Gridded):
         return cube
 
     def create_data_object(self, filenames, variable):
+        from disk_cube_cache import load_cached_data_object
+        return load_cached_data_object(self, filenames, variable, self._create_data_object)
+
+    def _create_data_object(self, filenames, variable):
         """Reads the data for a variable.
         :param filenames: list of names of files from which to read data
         :param variable: (optional) name of variable; if None, the file(s) must contain data for only one cube
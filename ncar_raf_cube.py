@@ -1,17 +1,17 @@
-import logging
 import os
 
 import numpy as np
 
 from cis.exceptions import FileFormatError
 from cis.data_io.products import AProduct
-from cis.utils import add_to_list_if_not_none, listify
-from cis.data_io.netcdf import get_metadata, get_netcdf_file_attributes, read_many_files_individually, \
-    get_netcdf_file_variables
+from cis.utils import listify
+from cis.data_io.netcdf import get_metadata, get_netcdf_file_attributes
 from cis.data_io.products.NCAR_NetCDF_RAF import NCAR_NetCDF_RAF_variable_name_selector
 
+from netcdf_campaign import CampaignProduct, concatenate_into, concatenate_variables
 
-class NCAR_NetCDF_RAF_Cube(AProduct):
+
+class NCAR_NetCDF_RAF_Cube(CampaignProduct, AProduct):
     """
     Data product for NCAR-RAF NetCDF files. This includes the subset of GASSP (which is its major use case)
     """
@@ -92,41 +92,6 @@ class NCAR_NetCDF_RAF_Cube(AProduct):
         except FileFormatError as ex:
             return ex.error_list
 
-    def _load_data_definition(self, filenames):
-        """
-        Load the definition of the data
-        :param filenames: filenames from which to load the data
-        :return: variable selector containing the data definitions
-        """
-        variables_list = [get_netcdf_file_variables(f) for f in filenames]
-        attributes = [get_netcdf_file_attributes(f) for f in filenames]
-
-        variable_selector = self.variableSelectorClass(attributes, variables_list)
-        return variable_selector
-
-    def _load_data(self, filenames, variable):
-        """
-        Open the file and find the correct variables to load in
-        :param filenames: the filenames to load
-        :param variable: an extra variable to load
-        :return: a list of load data and the variable selector used to load name it
-        """
-
-        variable_selector = self._load_data_definition(filenames)
-
-        variables_list = [variable_selector.time_variable_name]
-        add_to_list_if_not_none(variable_selector.latitude_variable_name, variables_list)
-        add_to_list_if_not_none(variable_selector.longitude_variable_name, variables_list)
-        add_to_list_if_not_none(variable_selector.altitude_variable_name, variables_list)
-        add_to_list_if_not_none(variable_selector.pressure_variable_name, variables_list)
-
-        logging.info("Listing coordinates: " + str(variables_list))
-        add_to_list_if_not_none(variable, variables_list)
-
-        data_variables = read_many_files_individually(filenames, variables_list)
-
-        return data_variables, variable_selector
-
     def _create_coordinates_list(self, data_variables, variable_selector):
         """
         Create a co-ordinate list for the data
@@ -179,8 +144,10 @@ class NCAR_NetCDF_RAF_Cube(AProduct):
         """
         from iris.cube import Cube
         from iris.coords import DimCoord
-        from cis.data_io.netcdf import read
-        from cis.utils import concatenate
+        from time_averaging import get_averaging_window
+
+        if get_averaging_window(self) is not None:
+            return self._create_averaged_cube(filenames, variable, get_averaging_window(self))
 
         data_variables, variable_selector = self._load_data(filenames, variable)
 
@@ -193,17 +160,54 @@ class NCAR_NetCDF_RAF_Cube(AProduct):
         aux_coord_name = variable_selector.find_auxiliary_coordinate(variable)
         if aux_coord_name is not None:
             # We assume that the auxilliary coordinate is the same shape across files
-            v = read(filenames[0], [aux_coord_name])[aux_coord_name]
+            v = variable_selector.file_variables[0][aux_coord_name]
             aux_meta = get_metadata(v)
             # We have to assume the shape here...
             dim_coords.append((DimCoord(v[:], var_name=aux_coord_name, units=aux_meta.units,
                                     long_name=aux_meta.long_name), (1,)))
 
         cube_meta = get_metadata(data_variables[variable][0])
-        return Cube(concatenate([d[:] for d in data_variables[variable]]),
+        return Cube(concatenate_variables(data_variables[variable]),
                     units=cube_meta.units, var_name=variable, long_name=cube_meta.long_name,
                     dim_coords_and_dims=dim_coords, aux_coords_and_dims=[(c, (0,)) for c in aux_coords])
 
+    def _create_averaged_cube(self, filenames, variable, window):
+        """
+        Stream the files into time window averages of the coordinates and data
+        :param filenames: List of filenames to read coordinates from
+        :param variable: the (possibly suffixed) variable to load
+        :param window: the length of the averaging window, in seconds
+        :return: Cube of the window statistic
+        """
+        from iris.cube import Cube
+        from iris.coords import AuxCoord, DimCoord
+        from netcdf_campaign import load_averaged_coordinates
+        from time_averaging import split_variable_statistic, get_window_statistic
+
+        if variable is None:
+            raise ValueError("Must specify variable")
+        file_variable, statistic = split_variable_statistic(variable)
+
+        coordinates, statistics, variable_selector = load_averaged_coordinates(self, filenames, file_variable, window)
+        aux_coords = []
+        for standard_name, axis, data, m in coordinates:
+            data, m = self._fix_averaged_coordinate(standard_name, data, m)
+            aux_coords.append(AuxCoord(data, units=m.units, standard_name=standard_name))
+        dim_coords = [(DimCoord(np.arange(len(aux_coords[0].points)), var_name='obs'), (0,))]
+
+        aux_coord_name = variable_selector.find_auxiliary_coordinate(file_variable)
+        if aux_coord_name is not None:
+            v = variable_selector.file_variables[0][aux_coord_name]
+            aux_meta = get_metadata(v)
+            dim_coords.append((DimCoord(v[:], var_name=aux_coord_name, units=aux_meta.units,
+                                        long_name=aux_meta.long_name), (1,)))
+
+        data, cube_meta = get_window_statistic(statistics, file_variable, statistic,
+                                               get_metadata(variable_selector.file_variables[0][file_variable]),
+                                               variable)
+        return Cube(data, units=cube_meta.units, var_name=variable, long_name=cube_meta.long_name,
+                    dim_coords_and_dims=dim_coords, aux_coords_and_dims=[(c, (0,)) for c in aux_coords])
+
     def create_data_object(self, filenames, variable):
         """
         Load the variable with it coordinates from the files
@@ -223,8 +227,7 @@ class NCAR_NetCDF_RAF_Cube(AProduct):
         :return: a coords object
         """
         from iris.coords import AuxCoord
-        from cis.utils import concatenate
-        data = concatenate([d[:] for d in data_variables[data_variable_name]])
+        data = concatenate_variables(data_variables[data_variable_name])
 
         m = get_metadata(data_variables[data_variable_name][0])
 
@@ -243,21 +246,22 @@ class NCAR_NetCDF_RAF_Cube(AProduct):
         from iris.coords import AuxCoord
         from six.moves import zip_longest
         from cis.time_util import convert_time_using_time_stamp_info_to_std_time as convert, cis_standard_time_unit
-        from cis.utils import concatenate
 
         timestamps = listify(timestamp)
         time_variables = data_variables[time_variable_name]
-        time_data = []
-        # Create a coordinate for each separate file to account for differing timestamps
-        for file_time_var, timestamp in zip_longest(time_variables, timestamps):
-            metadata = get_metadata(file_time_var)
-            if timestamp is not None:
-                time_d = convert(file_time_var[:], metadata.units, timestamp)
-            else:
-                time_d = metadata.units.convert(file_time_var[:], cis_standard_time_unit)
-            time_data.append(time_d)
-
-        return AuxCoord(concatenate(time_data), standard_name=standard_name, units=cis_standard_time_unit)
+
+        def convert_file_times():
+            # Convert each file separately to account for differing timestamps
+            for file_time_var, timestamp in zip_longest(time_variables, timestamps):
+                metadata = get_metadata(file_time_var)
+                if timestamp is not None:
+                    yield convert(file_time_var[:], metadata.units, timestamp)
+                else:
+                    yield metadata.units.convert(file_time_var[:], cis_standard_time_unit)
+
+        time_data = concatenate_into(convert_file_times(), sum(v.shape[0] for v in time_variables))
+
+        return AuxCoord(time_data, standard_name=standard_name, units=cis_standard_time_unit)
 
     def _create_fixed_value_coord(self, coord_axis, values, coord_units, points_counts, coord_name):
         """
@@ -0,0 +1,285 @@
+import logging
+
+from cis.utils import add_to_list_if_not_none
+
+from time_averaging import TimeAveraged
+
+
+def _read_file_definition(filename):
+    """
+    Open a NetCDF file once and return all of its (fully qualified) variables and its global attributes
+    """
+    from netCDF4 import Dataset
+    from cis.data_io.netcdf import _get_all_fully_qualified_variables
+
+    try:
+        f = Dataset(filename)
+    except RuntimeError as e:
+        raise IOError(e)
+    # The variables keep a reference to the open Dataset, so their data can still be read later
+    return _get_all_fully_qualified_variables(f), f.__dict__
+
+
+def read_file_definitions(filenames):
+    """
+    Open each file once, capturing both the variables and the attributes needed to build a variable selector. The
+    returned Variable instances are the data handles used to read the data, so no file needs re-opening. The files are
+    opened one after another as the netCDF4/HDF5 libraries aren't thread safe.
+
+    :param filenames: The NetCDF files to read
+    :return: A tuple of (list of variable dictionaries, list of attribute dictionaries), one entry per file
+    """
+    definitions = [_read_file_definition(f) for f in filenames]
+    return [d[0] for d in definitions], [d[1] for d in definitions]
+
+
+def load_data_definition(product, filenames):
+    """
+    Load the definition of the data, opening each file only once
+
+    :param product: The NCAR-RAF type product, providing variableSelectorClass
+    :param filenames: filenames from which to load the data
+    :return: variable selector containing the data definitions
+    """
+    variables_list, attributes = read_file_definitions(filenames)
+    variable_selector = product.variableSelectorClass(attributes, variables_list)
+    # Keep hold of the open variables so that the data can be read without opening the files again
+    variable_selector.file_variables = variables_list
+    return variable_selector
+
+
+def get_data_variables(variable_selector, filenames, variables):
+    """
+    Look up the data handles for the given variables in every file of a variable selector created by
+    load_data_definition
+
+    :return: A dictionary of lists of NetCDF Variable instances (one per file), keyed by variable name
+    """
+    from cis.exceptions import InvalidVariableError
+
+    data_variables = {}
+    for filename, file_variables in zip(filenames, variable_selector.file_variables):
+        for variable in variables:
+            try:
+                data_variables.setdefault(variable, []).append(file_variables[variable])
+            except KeyError:
+                raise InvalidVariableError(variable + ' could not be found in ' + filename)
+    return data_variables
+
+
+def load_data(product, filenames, variable):
+    """
+    Open the files (once each) and find the correct variables to load in
+
+    :param product: The NCAR-RAF type product
+    :param filenames: the filenames to load
+    :param variable: an extra variable to load
+    :return: a list of load data and the variable selector used to load name it
+    """
+    variable_selector = load_data_definition(product, filenames)
+
+    variables_list = [variable_selector.time_variable_name]
+    add_to_list_if_not_none(variable_selector.latitude_variable_name, variables_list)
+    add_to_list_if_not_none(variable_selector.longitude_variable_name, variables_list)
+    add_to_list_if_not_none(variable_selector.altitude_variable_name, variables_list)
+    add_to_list_if_not_none(variable_selector.pressure_variable_name, variables_list)
+
+    logging.info("Listing coordinates: " + str(variables_list))
+    add_to_list_if_not_none(variable, variables_list)
+
+    return get_data_variables(variable_selector, filenames, variables_list), variable_selector
+
+
+def concatenate_into(arrays, length):
+    """
+    Concatenate arrays along their first axis by copying each one into the right slice of a single preallocated
+    array. Passing a generator means only one of the input arrays needs to be in memory at a time. The result is
+    always in native byte order, any non-native inputs are swapped as they're copied in rather than in a separate pass.
+
+    :param arrays: An iterable of (possibly masked) arrays
+    :param length: The total length of the first axis of the result
+    :return: The concatenated array, which is only masked if any of the inputs were
+    """
+    import numpy as np
+
+    result, mask = None, None
+    start = 0
+    for array in arrays:
+        end = start + array.shape[0]
+        if result is None:
+            result = np.empty((length,) + array.shape[1:], dtype=array.dtype.newbyteorder('='))
+        elif np.promote_types(result.dtype, array.dtype) != result.dtype:
+            result = result.astype(np.promote_types(result.dtype, array.dtype))
+        result[start:end] = np.ma.getdata(array)
+        if np.ma.is_masked(array):
+            if mask is None:
+                mask = np.zeros(result.shape, dtype=bool)
+            mask[start:end] = np.ma.getmaskarray(array)
+        start = end
+    if mask is not None:
+        result = np.ma.masked_array(result, mask=mask)
+    return result
+
+
+def concatenate_variables(variables):
+    """
+    Read a NetCDF variable from each file into one preallocated array, sized from the variable shapes before any
+    data is read
+
+    :param variables: A list of NetCDF Variables, one per file
+    :return: The concatenated data
+    """
+    return concatenate_into((v[:] for v in variables), sum(v.shape[0] for v in variables))
+
+
+def load_averaged_coordinates(product, filenames, variable, window, flag_variable=None, max_valid_flag=1):
+    """
+    Stream the coordinates (and a variable) of the files into time window statistics, see time_averaging.average_files
+
+    :param product: The NCAR-RAF type product
+    :param filenames: the filenames to load
+    :param variable: an extra variable to load
+    :param window: The length of the averaging window, in seconds
+    :param flag_variable: The name of an optional quality flag variable for the extra variable
+    :param max_valid_flag: The largest good value of the quality flag
+    :return: A list of (standard_name, axis, data, metadata) tuples of the (mean) coordinates, the dictionary of
+     WindowStatistics and the variable selector
+    """
+    import numpy as np
+    from cf_units import Unit
+    from cis.data_io.netcdf import get_metadata
+    from cis.data_io.ungridded_data import Metadata
+    from cis.time_util import convert_time_using_time_stamp_info_to_std_time as convert, cis_standard_time_unit
+    from cis.utils import listify
+    from time_averaging import average_files, get_window_statistic
+
+    data_variables, variable_selector = load_data(product, filenames, variable)
+    file_variables = [{name: variables[i] for name, variables in data_variables.items()}
+                      for i in range(len(filenames))]
+    flags = None
+    if flag_variable is not None:
+        flag_variables = get_data_variables(variable_selector, filenames, [flag_variable])[flag_variable]
+        flags = [{variable: (flag_var, max_valid_flag)} for flag_var in flag_variables]
+
+    time_name = variable_selector.time_variable_name
+    time_units = [get_metadata(v).units for v in data_variables[time_name]]
+    timestamps = listify(variable_selector.time_stamp_info) if variable_selector.time_stamp_info is not None else []
+
+    def convert_time(i, data):
+        if i < len(timestamps) and timestamps[i] is not None:
+            return convert(data, time_units[i], timestamps[i])
+        return Unit(str(time_units[i])).convert(data, cis_standard_time_unit)
+
+    periodic = {}
+    if variable_selector.longitude_variable_name is not None:
+        periodic[variable_selector.longitude_variable_name] = 360
+    statistics = average_files(file_variables, time_name, window, convert_time, periodic, flags)
+
+    time_data = statistics[time_name].mean
+    coords = [('time', 'T', time_data, Metadata(name=time_name, standard_name='time', shape=time_data.shape,
+                                                 units=cis_standard_time_unit))]
+
+    def add_coord(standard_name, axis, name, fixed_value, fixed_units):
+        if fixed_value is not None:
+            coords.append((standard_name, axis, np.full(time_data.shape, float(fixed_value)),
+                           Metadata(name=standard_name, standard_name=standard_name, shape=time_data.shape,
+                                    units=fixed_units)))
+        elif name is not None:
+            m = get_metadata(data_variables[name][0])
+            m._name = m._name.lower()
+            m.standard_name = standard_name
+            data, m = get_window_statistic(statistics, name, 'mean', m)
+            coords.append((standard_name, axis, data, m))
+
+    station = variable_selector.station
+    add_coord('latitude', 'Y', variable_selector.latitude_variable_name,
+              variable_selector.station_latitude if station else None, 'degrees_north')
+    add_coord('longitude', 'X', variable_selector.longitude_variable_name,
+              variable_selector.station_longitude if station else None, 'degrees_east')
+    add_coord('altitude', 'Z', variable_selector.altitude_variable_name, variable_selector.altitude, 'meters')
+    add_coord('air_pressure', 'P', variable_selector.pressure_variable_name, None, None)
+
+    return coords, statistics, variable_selector
+
+
+def create_averaged_ungridded_data(product, filenames, variable, window, fix_coordinate=None, flag_variable=None):
+    """
+    Read time window averages of the coordinates, and optionally a variable, from NCAR-RAF type files. Appending
+    '_window_std' or '_window_count' to the variable name returns that statistic rather than the mean.
+
+    :param product: The NCAR-RAF type product
+    :param filenames: the filenames to load
+    :param variable: the (possibly suffixed) variable to load, or None to just load the coordinates
+    :param window: The length of the averaging window, in seconds
+    :param fix_coordinate: An optional function taking the standard name, data and metadata of each coordinate and
+     returning the (corrected) data and metadata
+    :param flag_variable: The name of an optional quality flag variable for the variable
+    :return: UngriddedData, or UngriddedCoordinates if no variable was given
+    """
+    from cis.data_io.netcdf import get_metadata
+    from cis.data_io.Coord import Coord, CoordList
+    from cis.data_io.ungridded_data import UngriddedCoordinates, UngriddedData
+    from time_averaging import split_variable_statistic, get_window_statistic
+
+    file_variable, statistic = split_variable_statistic(variable)
+    coordinates, statistics, variable_selector = load_averaged_coordinates(product, filenames, file_variable, window,
+                                                                           flag_variable)
+    coords = CoordList()
+    for standard_name, axis, data, m in coordinates:
+        if fix_coordinate is not None:
+            data, m = fix_coordinate(standard_name, data, m)
+        coords.append(Coord(data, m, axis))
+
+    if variable is None:
+        return UngriddedCoordinates(coords)
+
+    aux_coord_name = variable_selector.find_auxiliary_coordinate(file_variable)
+    if aux_coord_name is not None:
+        coords = product._add_aux_coordinate(coords, filenames[0], aux_coord_name, coords[0].data.size)
+
+    metadata = get_metadata(variable_selector.file_variables[0][file_variable])
+    data, metadata = get_window_statistic(statistics, file_variable, statistic, metadata, variable)
+    return UngriddedData(data, metadata, coords)
+
+
+class CampaignProduct(TimeAveraged):
+    """
+    Mixin with the loading and time window averaging shared by the NCAR-RAF type products (GASSP, GASSP_Cube, CLARIFY
+    and NCAR_NetCDF_RAF_Cube)
+    """
+
+    def _load_data_definition(self, filenames):
+        """
+        Load the definition of the data, opening each file once and keeping the variables for reading the data later
+        :param filenames: filenames from which to load the data
+        :return: variable selector containing the data definitions
+        """
+        return load_data_definition(self, filenames)
+
+    def _load_data(self, filenames, variable):
+        """
+        Open the file and find the correct variables to load in
+        :param filenames: the filenames to load
+        :param variable: an extra variable to load
+        :return: a list of load data and the variable selector used to load name it
+        """
+        return load_data(self, filenames, variable)
+
+    def _fix_averaged_coordinate(self, standard_name, data, m):
+        """
+        Correct the data and metadata of an averaged coordinate, this can be overridden in specific products
+        :return: the data and metadata
+        """
+        return data, m
+
+    def _create_averaged_coords(self, filenames, variable, window, flag_variable=None):
+        """
+        Stream the files into time window averages of the coordinates, and the variable if given
+        :param filenames: List of filenames to read coordinates from
+        :param variable: the (possibly suffixed) variable to load
+        :param window: the length of the averaging window, in seconds
+        :param flag_variable: the name of an optional quality flag variable for the variable
+        :return: UngriddedData, or UngriddedCoordinates if no variable was given
+        """
+        return create_averaged_ungridded_data(self, filenames, variable, window, self._fix_averaged_coordinate,
+                                              flag_variable)
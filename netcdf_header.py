@@ -0,0 +1,223 @@
+import logging
+import os
+
+# The headers read from each file, keyed by (path, mtime, size)
+_HEADERS = {}
+
+
+def _parse_load_workers(value):
+    """
+    :return: The number of load processes as a positive int, or 1 (to load serially) if value is None or invalid
+    """
+    if value is None:
+        return 1
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        workers = 0
+    if workers < 1:
+        logging.warning("Invalid number of load processes {!r}, loading the files serially instead".format(value))
+        return 1
+    return workers
+
+
+# The number of processes to load the cubes of multiple files with. The files are loaded serially unless this is set
+#  (to more than 1). Only the cube metadata is loaded in the workers, the (lazy) data is still read in this process.
+LOAD_WORKERS = _parse_load_workers(os.environ.get('CIS_LOAD_WORKERS', None))
+
+# Only load files in parallel when there are at least this many, otherwise starting the workers isn't worth it
+PARALLEL_LOAD_MIN_FILES = 4
+
+# The process pool the files are loaded in (and its number of workers), this is created on first use and then reused
+_LOAD_POOL = None
+_LOAD_POOL_WORKERS = 0
+
+
+def get_netcdf_header(filename):
+    """
+    Read the dimensions and variable attributes of a NetCDF file without reading any data. The result is memoized
+    per file.
+
+    :param filename: The NetCDF file
+    :return: A tuple of (dictionary of dimension sizes, dictionary of variable attribute dictionaries, dictionary of
+     variable dimensions), keyed by name
+    """
+    from netCDF4 import Dataset
+
+    stat = os.stat(filename)
+    key = os.path.abspath(filename), stat.st_mtime, stat.st_size
+    if key not in _HEADERS:
+        with Dataset(filename) as f:
+            dimensions = {name: len(dim) for name, dim in f.dimensions.items()}
+            attributes = {name: {a: var.getncattr(a) for a in var.ncattrs()} for name, var in f.variables.items()}
+            variable_dimensions = {name: var.dimensions for name, var in f.variables.items()}
+        _HEADERS[key] = dimensions, attributes, variable_dimensions
+    return _HEADERS[key]
+
+
+def find_matching_variables(filenames, name):
+    """
+    Find the NetCDF variables whose variable name, standard name or long name match the given name, using only the
+    file headers
+
+    :param filenames: The NetCDF files
+    :param name: The name to look for
+    :return: A sorted tuple of the matching variable names
+    """
+    matches = set()
+    for filename in filenames:
+        attributes = get_netcdf_header(filename)[1]
+        for var_name, var_attributes in attributes.items():
+            if name in (var_name, var_attributes.get('standard_name', None), var_attributes.get('long_name', None)):
+                matches.add(var_name)
+    return tuple(sorted(matches))
+
+
+def get_constrained_variables(filenames, constraint):
+    """
+    Work out which NetCDF variables a load constraint could select, so that only those need loading. The constraint
+    should still be applied to the loaded cubes as this may select more variables than it does.
+
+    :param filenames: The NetCDF files
+    :param constraint: A variable name, or an iris (or CIS Display) constraint
+    :return: A tuple of the variable names, or None if they can't be worked out from the constraint (e.g. it's None or
+     only has a cube function), in which case all the variables need loading
+    """
+    if constraint is None:
+        return None
+    if isinstance(constraint, str):
+        name = constraint
+    else:
+        name = getattr(constraint, 'display', None)
+        if name is None or name == 'None':
+            name = getattr(constraint, '_name', None)
+    if name is None:
+        return None
+    return find_matching_variables(filenames, name)
+
+
+def _load_raw_file_variables(filenames, variables=None, callback=None):
+    import iris
+    from iris.cube import CubeList
+
+    if variables is None:
+        return iris.load_raw(filenames, callback=callback)
+    cubes = CubeList()
+    for variable in variables:
+        if hasattr(iris, 'NameConstraint'):
+            constraint = iris.NameConstraint(var_name=variable)
+        else:
+            constraint = iris.Constraint(cube_func=lambda c, variable=variable: c.var_name == variable)
+        cubes.extend(iris.load_raw(filenames, constraint, callback=callback))
+    return cubes
+
+
+def _load_raw_file(filename, variables, callback):
+    return _load_raw_file_variables([filename], variables, callback)
+
+
+def get_load_workers(filenames, max_workers=None):
+    """
+    :return: The number of processes to load the given files with (1 to load them serially)
+    """
+    max_workers = LOAD_WORKERS if max_workers is None else _parse_load_workers(max_workers)
+    if len(filenames) < PARALLEL_LOAD_MIN_FILES:
+        return 1
+    return min(max_workers, len(filenames))
+
+
+def _get_load_pool(workers):
+    """
+    Get the shared process pool, replacing it if it has fewer than the given number of workers
+    """
+    global _LOAD_POOL, _LOAD_POOL_WORKERS
+    from concurrent.futures import ProcessPoolExecutor
+
+    if _LOAD_POOL is None or _LOAD_POOL_WORKERS < workers:
+        _shutdown_load_pool()
+        _LOAD_POOL = ProcessPoolExecutor(max_workers=workers)
+        _LOAD_POOL_WORKERS = workers
+    return _LOAD_POOL
+
+
+def _shutdown_load_pool():
+    global _LOAD_POOL, _LOAD_POOL_WORKERS
+    if _LOAD_POOL is not None:
+        _LOAD_POOL.shutdown(wait=False)
+        _LOAD_POOL, _LOAD_POOL_WORKERS = None, 0
+
+
+def load_raw_variables(filenames, variables=None, callback=None, max_workers=None):
+    """
+    Load the raw cubes of only the given NetCDF variables, passing a name constraint to iris so that (with Iris 3)
+    the other variables are skipped before any cubes are built for them. If LOAD_WORKERS (or max_workers) is set,
+    multiple files are loaded concurrently in a shared pool of processes (one file per task, with the callback applied
+    in the workers), falling back to loading them serially if that fails. The cubes are returned in the order of the
+    files.
+
+    :param filenames: The NetCDF files
+    :param variables: A list of NetCDF variable names, or None to load every variable
+    :param callback: The iris load callback, this must be picklable (e.g. a module level or static function) for the
+     files to be loaded in parallel
+    :param max_workers: The maximum number of processes to use, defaults to LOAD_WORKERS
+    :return: A CubeList
+    """
+    import itertools
+    import pickle
+    from concurrent.futures.process import BrokenProcessPool
+    from iris.cube import CubeList
+
+    workers = get_load_workers(filenames, max_workers)
+    if workers > 1:
+        try:
+            per_file = list(_get_load_pool(workers).map(_load_raw_file, filenames, itertools.repeat(variables),
+                                                        itertools.repeat(callback)))
+        except (BrokenProcessPool, OSError) as e:
+            logging.warning("The file loading processes failed, loading the files serially instead: {}".format(e))
+            _shutdown_load_pool()
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            logging.info("Unable to load the files in parallel, loading them serially instead: {}".format(e))
+        else:
+            return CubeList(itertools.chain.from_iterable(per_file))
+    return _load_raw_file_variables(filenames, variables, callback)
+
+
+def get_gridded_variable_names(filenames, allowed_dimensions=()):
+    """
+    List the variables which only vary over time, latitude, longitude or vertical dimensions (or the given allowed
+    dimensions), using only the file headers. This mirrors the checks NetCDF_Gridded.get_variable_names makes on the
+    loaded cubes.
+
+    :param filenames: The NetCDF files, pass only the first of a homogeneous series to read a single header
+    :param allowed_dimensions: The names of any other dimensions to allow, e.g. 'mlev'
+    :return: A set of variable names
+    """
+    from cf_units import Unit
+
+    def is_allowed(dimension, sizes, attributes):
+        # Dimensions without a coordinate variable don't become dimension coordinates, so iris doesn't check them
+        if sizes[dimension] <= 1 or dimension in allowed_dimensions or dimension not in attributes:
+            return True
+        dim_attributes = attributes[dimension]
+        try:
+            units = Unit(dim_attributes.get('units', '1'))
+        except ValueError:
+            return False
+        return units.is_time() or units.is_time_reference() or units.is_vertical() or \
+            units.is_convertible(Unit('degrees'))
+
+    variables = set()
+    for filename in filenames:
+        sizes, attributes, variable_dimensions = get_netcdf_header(filename)
+        # Variables referenced as coordinates or bounds of other variables aren't loaded as cubes
+        referenced = set()
+        for var_attributes in attributes.values():
+            for reference in ('coordinates', 'bounds'):
+                referenced.update(str(var_attributes.get(reference, '')).split())
+        for var_name, dimensions in variable_dimensions.items():
+            # Nor are dimension coordinate variables
+            if dimensions == (var_name,) or var_name in referenced:
+                continue
+            if all(is_allowed(d, sizes, attributes) for d in dimensions):
+                variables.add(var_name)
+    return variables
@@ -0,0 +1,158 @@
+import logging
+
+import numpy as np
+
+# The statistics which can be calculated over time
+STATISTICS = ('mean', 'sum', 'min', 'max', 'count')
+
+# The month numbers in each (meteorological) season
+SEASONS = {'djf': (12, 1, 2), 'mam': (3, 4, 5), 'jja': (6, 7, 8), 'son': (9, 10, 11)}
+_MONTH_SEASONS = {month: season for season, months in SEASONS.items() for month in months}
+_SEASON_ORDER = {season: i for i, season in enumerate(SEASONS)}
+
+
+def _get_group_keys(dates, group_by):
+    """
+    :return: The group (None, the month number or season name) of each date
+    """
+    if group_by is None:
+        return [None] * len(dates)
+    elif group_by == 'month':
+        return [d.month for d in dates]
+    elif group_by == 'season':
+        return [_MONTH_SEASONS[d.month] for d in dates]
+    raise ValueError("Unknown temporal grouping: {}, valid groupings are 'month' and 'season'".format(group_by))
+
+
+def _load_file_cube(product, filename, variable):
+    """
+    Load a variable from a single file, bypassing the cube cache so that only this file is held in memory, with time
+    as its first dimension
+    """
+    import iris
+    from iris.util import new_axis
+    from cis.exceptions import InvalidVariableError
+    from netcdf_header import get_constrained_variables, load_raw_variables
+    from echam_ham_pascals import _merge_cubes
+
+    constraint = iris.Constraint(cube_func=lambda c: variable in (c.var_name, c.standard_name, c.long_name))
+    variables = get_constrained_variables([filename], variable)
+    if not variables:
+        raise InvalidVariableError("Variable not found: {} \nTo see a list of variables run: cis info {}"
+                                   .format(variable, filename))
+    # Use the multiple file callback as this doesn't squeeze out a length-one time dimension
+    cubes = load_raw_variables([filename], variables, callback=product.load_multiple_files_callback)
+    cube = _merge_cubes(cubes.extract(constraint), variable)
+
+    if not cube.coord_dims('time'):
+        cube = new_axis(cube, 'time')
+    time_dim = cube.coord_dims('time')[0]
+    if time_dim != 0:
+        cube.transpose([time_dim] + [d for d in range(cube.ndim) if d != time_dim])
+    return cube
+
+
+def _fold(accumulator, data, statistic):
+    """
+    Add a block of time steps (the first dimension of data) to the running statistics of a group
+    """
+    valid = ~np.ma.getmaskarray(data)
+    accumulator['count'] += valid.sum(axis=0)
+    if statistic in ('mean', 'sum'):
+        accumulator['sum'] += np.ma.filled(data, 0).astype(np.float64).sum(axis=0)
+    elif statistic == 'min':
+        accumulator['min'] = np.fmin(accumulator['min'], np.where(valid, np.ma.getdata(data), np.inf).min(axis=0))
+    elif statistic == 'max':
+        accumulator['max'] = np.fmax(accumulator['max'], np.where(valid, np.ma.getdata(data), -np.inf).max(axis=0))
+
+
+def _new_accumulator(shape):
+    return dict(count=np.zeros(shape, dtype=np.int64), sum=np.zeros(shape), min=np.full(shape, np.inf),
+                max=np.full(shape, -np.inf), start=None, end=None)
+
+
+def _get_result(accumulator, statistic):
+    count = accumulator['count']
+    if statistic == 'count':
+        return count
+    if statistic == 'mean':
+        values = accumulator['sum'] / np.where(count == 0, 1, count)
+    else:
+        values = accumulator[statistic]
+    return np.ma.masked_array(values, mask=count == 0)
+
+
+def _create_result_cube(template, values, statistic, time_coord, start, end, group_by, key):
+    from iris.coords import AuxCoord, CellMethod
+
+    cube = template.copy(data=values)
+    if statistic == 'count':
+        cube.units = '1'
+    cube.add_cell_method(CellMethod(statistic, coords='time'))
+    units = time_coord.units
+    start, end = units.date2num(start), units.date2num(end)
+    cube.add_aux_coord(AuxCoord([(start + end) / 2.0], bounds=[[start, end]], standard_name='time', units=units))
+    if group_by == 'month':
+        cube.add_aux_coord(AuxCoord([key], long_name='month_number', units='1'))
+    elif group_by == 'season':
+        cube.add_aux_coord(AuxCoord([key], long_name='clim_season'))
+    return cube
+
+
+def reduce_files_over_time(product, filenames, variable, statistic='mean', group_by=None):
+    """
+    Calculate a statistic of a variable over time (or within each month or season of the year) by folding in one file
+    at a time, so only the running statistics and a single file's data are ever held in memory
+
+    :param product: The (ECHAM) product instance to read the files with
+    :param filenames: The files of the time series
+    :param variable: The variable name
+    :param statistic: One of 'mean', 'sum', 'min', 'max' or 'count' (the number of valid values)
+    :param group_by: None to reduce over the whole series, or 'month' or 'season' to reduce each month or season of the
+     year separately (e.g. a climatology)
+    :return: A GriddedData object, with a leading month_number or clim_season dimension if grouped
+    """
+    import cis.data_io.gridded_data as gd
+    from iris.cube import CubeList
+
+    if statistic not in STATISTICS:
+        raise ValueError("Unknown statistic: {}, valid statistics are {}".format(statistic, ', '.join(STATISTICS)))
+
+    accumulators = {}
+    template, time_coord = None, None
+    for filename in filenames:
+        cube = _load_file_cube(product, filename, variable)
+        coord = cube.coord('time')
+        dates = coord.units.num2date(coord.points)
+        if template is None:
+            # The result is shaped like a single time step, without any of the coordinates which vary in time
+            template, time_coord = cube[0].copy(), coord.copy()
+            for factory in template.aux_factories:
+                if any(0 in cube.coord_dims(c) for c in factory.dependencies.values() if c is not None):
+                    template.remove_aux_factory(factory)
+            for c in cube.coords(dim_coords=False) + cube.dim_coords:
+                if 0 in cube.coord_dims(c):
+                    template.remove_coord(c)
+        elif cube.shape[1:] != template.shape:
+            raise ValueError("The shape of {} in {} doesn't match the previous files".format(variable, filename))
+
+        data = np.ma.asarray(cube.data)
+        keys = _get_group_keys(dates, group_by)
+        for key in sorted(set(keys), key=str):
+            indices = [i for i, k in enumerate(keys) if k == key]
+            accumulator = accumulators.setdefault(key, _new_accumulator(template.shape))
+            _fold(accumulator, data[indices], statistic)
+            accumulator['start'] = min(d for d in [accumulator['start'], dates[indices[0]]] if d is not None)
+            accumulator['end'] = max(d for d in [accumulator['end'], dates[indices[-1]]] if d is not None)
+        logging.debug("Folded {} time steps from {}".format(len(dates), filename))
+
+    if template is None:
+        raise ValueError("No files to reduce")
+
+    order = _SEASON_ORDER.get if group_by == 'season' else (lambda k: k)
+    results = CubeList(_create_result_cube(template, _get_result(accumulators[key], statistic), statistic, time_coord,
+                                           accumulators[key]['start'], accumulators[key]['end'], group_by, key)
+                       for key in sorted(accumulators, key=order))
+    if group_by is None:
+        return gd.make_from_cube(results[0])
+    return gd.make_from_cube(results.merge_cube())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The plugins are flat modules in the repository root, as they are in a CIS plugin directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('cis')
+
+
+class UnreadableProduct(object):
+
+    def get_file_format(self, filename):
+        raise IOError("Not a campaign file: {}".format(filename))
+
+
+def test_unreadable_file_is_always_included(tmpdir):
+    from campaign_catalogue import query_campaign_catalogue, update_campaign_catalogue
+
+    source = tmpdir.join('broken.nc')
+    source.write('')
+    catalogue_filename = str(tmpdir.join('catalogue.sqlite'))
+    product = UnreadableProduct()
+
+    update_campaign_catalogue([str(source)], product, catalogue_filename)
+
+    assert query_campaign_catalogue(catalogue_filename, product) == [str(source)]
+    assert query_campaign_catalogue(catalogue_filename, product, lon_min=10, lon_max=20, lat_min=-5, lat_max=5,
+                                    alt_min=0, alt_max=1000, variable='CCN_COL_A',
+                                    file_format='NetCDF/GASSP') == [str(source)]
+
+
+def test_removed_file_is_dropped(tmpdir):
+    from campaign_catalogue import build_campaign_catalogue, query_campaign_catalogue
+
+    archive = tmpdir.mkdir('archive')
+    kept, removed = archive.join('kept.nc'), archive.join('removed.nc')
+    kept.write('')
+    removed.write('')
+    product = UnreadableProduct()
+
+    catalogue_filename = build_campaign_catalogue(str(archive), product)
+    assert query_campaign_catalogue(catalogue_filename, product) == [str(kept), str(removed)]
+
+    removed.remove()
+    assert query_campaign_catalogue(catalogue_filename, product) == [str(kept)]
+
+    build_campaign_catalogue(str(archive), product)
+    connection = sqlite3.connect(catalogue_filename)
+    assert [row[0] for row in connection.execute("SELECT filename FROM campaign_files")] == [str(kept)]
+    connection.close()
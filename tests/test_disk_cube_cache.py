@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+iris = pytest.importorskip('iris')
+pytest.importorskip('cis')
+
+
+class DummyProduct(object):
+    cube_cache_dir = None
+    priority = 10
+
+
+def _create(filenames, variable):
+    import cis.data_io.gridded_data as gd
+    from iris.coords import DimCoord
+    from iris.cube import Cube
+
+    cube = Cube(np.arange(6, dtype=np.float64).reshape(2, 3), var_name=variable, units='K')
+    cube.add_dim_coord(DimCoord([0., 1.], standard_name='latitude', units='degrees'), 0)
+    cube.add_dim_coord(DimCoord([0., 1., 2.], standard_name='longitude', units='degrees'), 1)
+    return gd.make_from_cube(cube)
+
+
+def test_entry_is_written_and_read_back(tmpdir):
+    from disk_cube_cache import load_cached_data_object
+
+    source = tmpdir.join('source.nc')
+    source.write('')
+    product = DummyProduct()
+    product.cube_cache_dir = str(tmpdir.mkdir('cache'))
+    calls = []
+
+    def create(filenames, variable):
+        calls.append(variable)
+        return _create(filenames, variable)
+
+    first = load_cached_data_object(product, [str(source)], 'temp', create)
+    entries = sorted(os.listdir(product.cube_cache_dir))
+    assert [os.path.splitext(e)[1] for e in entries] == ['.json', '.nc']
+
+    second = load_cached_data_object(product, [str(source)], 'temp', create)
+    assert calls == ['temp']
+    np.testing.assert_array_equal(second.data, first.data)
+    assert second.var_name == 'temp'
+
+
+def test_changed_source_file_is_not_served_from_cache(tmpdir):
+    from disk_cube_cache import load_cached_data_object
+
+    source = tmpdir.join('source.nc')
+    source.write('')
+    product = DummyProduct()
+    product.cube_cache_dir = str(tmpdir.mkdir('cache'))
+    calls = []
+
+    def create(filenames, variable):
+        calls.append(variable)
+        return _create(filenames, variable)
+
+    load_cached_data_object(product, [str(source)], 'temp', create)
+    source.write('modified')
+    load_cached_data_object(product, [str(source)], 'temp', create)
+    assert calls == ['temp', 'temp']
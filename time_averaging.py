@@ -0,0 +1,291 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Default averaging window, in seconds, for the aircraft products. If neither this nor the product's averaging_window
+#  is set the data is read at its full rate.
+AVERAGING_WINDOW = os.environ.get('CIS_AIRCRAFT_AVERAGING_WINDOW', None)
+
+# The number of records to read from a file at a time
+CHUNK_SIZE = 36000
+
+# The suffixes which can be appended to a variable name to read the standard deviation or number of valid records in
+#  each window rather than the mean, e.g. 'CN_window_std'
+STATISTIC_SUFFIXES = {'_window_std': 'std', '_window_count': 'count'}
+
+WindowStatistics = namedtuple('WindowStatistics', ['mean', 'std', 'count'])
+
+
+class TimeAveraged(object):
+    """
+    Mixin for the aircraft products which can average their data over time windows as it's read
+    """
+
+    # Length of the time window (in seconds) to average the data over as it's read, None reads it at full rate. Append
+    #  '_window_std' or '_window_count' to a variable name to read the standard deviation or count in each window.
+    averaging_window = None
+
+
+def get_averaging_window(product):
+    """
+    :return: The averaging window (in seconds) configured for a product, or None if it's reading at full rate
+    """
+    window = product.averaging_window if product.averaging_window is not None else AVERAGING_WINDOW
+    return float(window) if window is not None else None
+
+
+def split_variable_statistic(variable):
+    """
+    Split a (possibly suffixed) variable name into the variable to read and the statistic requested
+
+    :param variable: The variable name, e.g. 'CN' or 'CN_window_std'
+    :return: A tuple of the variable name and statistic ('mean', 'std' or 'count')
+    """
+    if variable is not None:
+        for suffix, statistic in STATISTIC_SUFFIXES.items():
+            if variable.endswith(suffix):
+                return variable[:-len(suffix)], statistic
+    return variable, 'mean'
+
+
+def get_window_statistic(statistics, variable, statistic, metadata, requested_variable=None):
+    """
+    Get one of the window statistics of a variable, updating the metadata read from the file to describe it
+
+    :param statistics: The dictionary of WindowStatistics returned by average_files
+    :param variable: The name of the variable in the file
+    :param statistic: The statistic to return ('mean', 'std' or 'count')
+    :param metadata: The Metadata of the (full-rate) variable
+    :param requested_variable: The name the statistic was requested as, e.g. 'CN_window_std'
+    :return: A tuple of the data and the metadata
+    """
+    data = getattr(statistics[variable], statistic)
+    metadata.shape = data.shape
+    if statistic != 'mean':
+        metadata._name = requested_variable or variable
+        metadata.long_name = "{} ({} per window)".format(metadata.long_name, statistic)
+        if statistic == 'count':
+            metadata.units = '1'
+    return data, metadata
+
+
+def _sum_rows(inverse, n_bins, values):
+    """
+    Sum the rows of a 2-D array into bins, given the bin index of each row
+    """
+    sums = np.empty((n_bins, values.shape[1]))
+    for i in range(values.shape[1]):
+        sums[:, i] = np.bincount(inverse, weights=values[:, i], minlength=n_bins)
+    return sums
+
+
+def _bin_sums(inverse, n_bins, values, valid):
+    """
+    Sum the values, squared values and number of valid values of each column of a 2-D array into bins
+    """
+    return (_sum_rows(inverse, n_bins, values), _sum_rows(inverse, n_bins, values * values),
+            _sum_rows(inverse, n_bins, valid.astype(np.float64)))
+
+
+def _average_file(variables, time_name, window, convert_time, periodic, flags, chunk_size):
+    """
+    Stream the variables of a single file in chunks, accumulating the sum, sum of squares and count of each variable
+    in each time window. Only these partial sums (one row per window per chunk) are kept, never the full-rate data.
+    """
+    n_records = variables[time_name].shape[0]
+    window_days = window / 86400.0
+
+    references = {}
+    partial_bins, partial_sums = [], {name: [] for name in variables}
+    for start in range(0, n_records, chunk_size):
+        stop = min(start + chunk_size, n_records)
+        time = np.ma.masked_invalid(convert_time(variables[time_name][start:stop]).astype(np.float64))
+        valid_time = ~np.ma.getmaskarray(time)
+        # Round off any error from the unit conversion first, so times on a window boundary aren't put in the window
+        #  before it
+        bins, inverse = np.unique(np.floor(np.round(time.data[valid_time] / window_days, 6)).astype(np.int64),
+                                  return_inverse=True)
+        partial_bins.append(bins)
+
+        for name, var in variables.items():
+            data = time if name == time_name else np.ma.asarray(var[start:stop], dtype=np.float64)
+            if name in flags:
+                # Mask out any records with bad quality flags before they're included in the averages
+                flag_var, max_valid_flag = flags[name]
+                data = np.ma.masked_where(np.ma.filled(flag_var[start:stop] > max_valid_flag, False), data)
+            data = np.ma.masked_invalid(data[valid_time])
+            data = data.reshape((data.shape[0], -1))
+            if name not in references:
+                # Accumulate the differences from the first value to avoid losing precision in the sums of squares
+                references[name] = float(data.compressed()[0]) if data.count() else 0.0
+            diff = data - references[name]
+            if name in periodic:
+                diff = (diff + periodic[name] / 2.0) % periodic[name] - periodic[name] / 2.0
+            partial_sums[name].append(_bin_sums(inverse, len(bins), diff.filled(0.0), ~np.ma.getmaskarray(diff)))
+
+    # A window can span more than one chunk, so combine the partial sums
+    if partial_bins:
+        bins, inverse = np.unique(np.concatenate(partial_bins), return_inverse=True)
+    else:
+        bins, inverse = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    statistics = {}
+    for name, var in variables.items():
+        trailing_shape = var.shape[1:]
+        if partial_sums[name]:
+            sums, squares, counts = [_sum_rows(inverse, len(bins), np.concatenate([p[i] for p in partial_sums[name]]))
+                                     for i in range(3)]
+        else:
+            sums = squares = counts = np.zeros((0, int(np.prod(trailing_shape))))
+        empty = counts == 0
+        counts = np.where(empty, 1, counts)
+        mean = sums / counts
+        std = np.sqrt(np.maximum(squares / counts - mean * mean, 0.0))
+        mean += references.get(name, 0.0)
+        if name in periodic:
+            mean = (mean + periodic[name] / 2.0) % periodic[name] - periodic[name] / 2.0
+        counts = np.where(empty, 0, np.rint(counts)).astype(np.int64)
+
+        shape = (len(bins),) + trailing_shape
+        statistics[name] = WindowStatistics(np.ma.masked_array(mean, mask=empty).reshape(shape),
+                                            np.ma.masked_array(std, mask=empty).reshape(shape),
+                                            counts.reshape(shape))
+    return statistics
+
+
+def average_files(file_variables, time_name, window, convert_time=None, periodic=None, flags=None, chunk_size=None):
+    """
+    Average time-series variables over fixed windows of time, streaming each file in chunks so that only the
+    per-window statistics are held in memory. Windows are aligned to multiples of the window length (in CIS standard
+    time) so they are consistent between files, but a window is not combined across two files.
+
+    :param file_variables: A list of dictionaries of NetCDF Variables (one dictionary per file) keyed by name, all of
+     which share the leading (time) dimension
+    :param time_name: The name of the time variable
+    :param window: The length of the averaging window, in seconds
+    :param convert_time: A function taking the file index and an array of raw times and returning them as CIS
+     standard time. Defaults to assuming the times are already in standard time
+    :param periodic: A dictionary of the period of any periodic variables (e.g. {'LON': 360}). These are averaged
+     about their first value and the means are returned in the range [-period/2, period/2)
+    :param flags: A list (one per file) of dictionaries of (flag Variable, maximum valid flag) tuples, keyed by the name
+     of the variable they apply to. Records with a larger flag value are excluded from the averages
+    :param chunk_size: The number of records to read at a time, defaults to CHUNK_SIZE
+    :return: A dictionary of WindowStatistics (mean, std and count arrays, with one row per window) keyed by name
+    """
+    periodic = periodic or {}
+    flags = flags or [{} for _ in file_variables]
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    per_file = []
+    for i, variables in enumerate(file_variables):
+        for var in variables.values():
+            # Make sure fill values and scalings are applied when reading each chunk
+            var.set_auto_maskandscale(True)
+        for flag_var, _ in flags[i].values():
+            flag_var.set_auto_maskandscale(True)
+        convert = (lambda data, i=i: convert_time(i, data)) if convert_time is not None else np.ma.asarray
+        per_file.append(_average_file(variables, time_name, window, convert, periodic, flags[i], chunk_size))
+
+    return {name: WindowStatistics(*[np.ma.concatenate([f[name][i] for f in per_file]) for i in range(3)])
+            for name in file_variables[0]}
+
+
+def get_time_converter(time_variables):
+    """
+    Work out how to convert the raw times read from each file into days, so they can be binned into windows, and how
+    to convert the mean times back
+
+    :param time_variables: A list of the NetCDF time Variables, one per file
+    :return: A tuple of a function taking the file index and raw times and returning them in days (CIS standard time
+     if the units are a time reference), and a function taking the mean times and returning them with their units
+    """
+    from cf_units import Unit
+    from cis.data_io.netcdf import get_metadata
+    from cis.time_util import cis_standard_time_unit
+
+    units = []
+    for var in time_variables:
+        try:
+            units.append(Unit(str(get_metadata(var).units)))
+        except ValueError:
+            raise ValueError("Unable to interpret the time units of {} to average it: {}"
+                             .format(var.name, get_metadata(var).units))
+
+    def convert_time(i, data):
+        if units[i].is_time_reference():
+            return units[i].convert(data, cis_standard_time_unit)
+        # e.g. seconds since midnight, the windows are still aligned to the start of the day
+        return units[i].convert(data, Unit('days'))
+
+    def convert_back(data):
+        if units[0].is_time_reference():
+            return data, cis_standard_time_unit
+        return Unit('days').convert(data, units[0]), units[0]
+
+    return convert_time, convert_back
+
+
+def average_read_variables(var_data, time_name, window, periodic=None, convert_time=None):
+    """
+    Average the variables returned by read_many_files_individually over time windows, see average_files
+
+    :param var_data: A dictionary of lists of NetCDF Variables (one per file) keyed by name
+    :return: A dictionary of WindowStatistics keyed by name
+    """
+    n_files = len(var_data[time_name])
+    return average_files([{name: variables[i] for name, variables in var_data.items()} for i in range(n_files)],
+                         time_name, window, convert_time, periodic=periodic)
+
+
+class WindowAverager(object):
+    """
+    Averages the variables read by the aircraft readers (BAS_aircraft, CARIBIC and flight_track) over time windows if
+    the product has an averaging window set, otherwise it passes the full rate data straight through
+    """
+
+    def __init__(self, product, variable):
+        """
+        :param product: The product instance reading the data
+        :param variable: The (possibly suffixed) variable requested
+        """
+        self.window = get_averaging_window(product)
+        self.requested_variable = variable
+        if self.window is not None:
+            self.variable, self.statistic = split_variable_statistic(variable)
+        else:
+            self.variable, self.statistic = variable, 'mean'
+        self.statistics = None
+        self.time_name = None
+        self._convert_time_back = None
+
+    def average(self, var_data, time_name, periodic=None):
+        """
+        Stream the data into time window averages rather than holding it at full rate, if a window is set
+
+        :param var_data: A dictionary of lists of NetCDF Variables (one per file) keyed by name
+        :param time_name: The name of the time variable
+        :param periodic: A dictionary of the period of any periodic variables (e.g. {'LON': 360})
+        """
+        if self.window is not None:
+            convert_time, self._convert_time_back = get_time_converter(var_data[time_name])
+            self.statistics = average_read_variables(var_data, time_name, self.window, periodic, convert_time)
+            self.time_name = time_name
+
+    def get_data(self, var_data, name, metadata):
+        """
+        Get the data to create a coordinate or the requested variable from
+
+        :param var_data: A dictionary of lists of NetCDF Variables (one per file) keyed by name
+        :param name: The variable name in the files
+        :param metadata: The Metadata read from the (first) file
+        :return: A tuple of the data (the list of Variables if not averaging) and metadata
+        """
+        if self.statistics is None:
+            return var_data[name], metadata
+        statistic = self.statistic if name == self.variable else 'mean'
+        data, metadata = get_window_statistic(self.statistics, name, statistic, metadata,
+                                              self.requested_variable if name == self.variable else None)
+        if name == self.time_name and statistic == 'mean':
+            data, metadata.units = self._convert_time_back(data)
+        return data, metadata
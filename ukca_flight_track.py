@@ -4,9 +4,10 @@ Workaround for a bug introduced in 1.5.2 where all units got converted to lower
 from cis.data_io.products import AProduct
 from cf_units import Unit
 import logging
+from time_averaging import TimeAveraged
 
 
-class flight_track(AProduct):
+class flight_track(TimeAveraged, AProduct):
 
     def get_file_signature(self):
         return [r'.*\.nc']
@@ -16,26 +17,40 @@ class flight_track(AProduct):
         from cis.data_io.ungridded_data import UngriddedCoordinates, UngriddedData
         from cis.data_io.Coord import Coord, CoordList
         from cis.exceptions import InvalidVariableError
+        from time_averaging import WindowAverager
+
+        averager = WindowAverager(self, usr_variable)
+        usr_variable = averager.variable
 
         variables = [("lon", "x", 'longitude'), ("lat", "y", 'latitude'), ("alt", "z", 'altitude'),
                      ("time", "t", 'time'), ("p", "p", 'air_pressure')]
 
         logging.info("Listing coordinates: " + str(variables))
 
-        coords = CoordList()
+        var_data = {}
         for variable in variables:
             try:
-                var_data = read_many_files_individually(filenames, variable[0])[variable[0]]
-                meta = get_metadata(var_data[0])
-                meta.standard_name = variable[2]
-                # Some of the variables have an illegal name attribute...
-                meta.misc.pop('name', None)
-                c = Coord(var_data, meta, axis=variable[1])
-                if variable[1] == 'z':
-                    c.convert_units('m')
-                coords.append(c)
+                var_data[variable[0]] = read_many_files_individually(filenames, variable[0])[variable[0]]
             except InvalidVariableError:
                 pass
+        if usr_variable is not None:
+            var_data[usr_variable] = read_many_files_individually(filenames, usr_variable)[usr_variable]
+
+        averager.average(var_data, "time", {"lon": 360})
+
+        coords = CoordList()
+        for variable in variables:
+            if variable[0] not in var_data:
+                continue
+            meta = get_metadata(var_data[variable[0]][0])
+            meta.standard_name = variable[2]
+            # Some of the variables have an illegal name attribute...
+            meta.misc.pop('name', None)
+            data, meta = averager.get_data(var_data, variable[0], meta)
+            c = Coord(data, meta, axis=variable[1])
+            if variable[1] == 'z':
+                c.convert_units('m')
+            coords.append(c)
 
         # Note - We don't need to convert this time coord as it should have been written in our
         #  'standard' time unit
@@ -43,10 +58,10 @@ class flight_track(AProduct):
         if usr_variable is None:
             res = UngriddedCoordinates(coords)
         else:
-            usr_var_data = read_many_files_individually(filenames, usr_variable)[usr_variable]
-            meta =get_metadata(usr_var_data[0])
+            meta =get_metadata(var_data[usr_variable][0])
             # Some of the variables have an illegal name attribute...
             meta.misc.pop('name', None)
+            usr_var_data, meta = averager.get_data(var_data, usr_variable, meta)
             res = UngriddedData(usr_var_data, meta, coords)
 
         return res